@@ -0,0 +1,32 @@
+-- 03_create_metrics_jobs.sql
+-- Synthetic Bond Risk Lab
+-- Creates metrics_jobs: work queue for src/metrics_worker.py. The coordinator
+-- enqueues (as_of, bond_id range) tasks; workers claim them with
+-- FOR UPDATE SKIP LOCKED and heartbeat while pricing, so tasks of a lost
+-- worker can be reclaimed once heartbeat_at goes stale.
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS metrics_jobs (
+    job_id BIGSERIAL PRIMARY KEY,
+    as_of DATE NOT NULL,
+    bond_id_lo INT NOT NULL,             -- inclusive
+    bond_id_hi INT NOT NULL,             -- inclusive
+    status TEXT NOT NULL DEFAULT 'pending'
+        CHECK (status IN ('pending', 'running', 'done', 'failed')),
+    worker_id TEXT,                      -- host:pid of the current / last claimant
+    heartbeat_at TIMESTAMPTZ,
+    attempts INT NOT NULL DEFAULT 0,
+    bonds_priced INT,
+    error TEXT,
+    created_at TIMESTAMPTZ DEFAULT NOW(),
+    started_at TIMESTAMPTZ,
+    finished_at TIMESTAMPTZ,
+    UNIQUE (as_of, bond_id_lo, bond_id_hi)
+);
+
+-- claim query scans open jobs only
+CREATE INDEX IF NOT EXISTS metrics_jobs_open_idx
+    ON metrics_jobs (job_id) WHERE status IN ('pending', 'running', 'failed');
+
+COMMIT;
@@ -0,0 +1,87 @@
+-- 04_create_bond_metrics_history.sql
+-- Synthetic Bond Risk Lab
+-- History storage for bond risk metrics (METRICS_STORAGE=history, src/metrics_history.py):
+-- a full snapshot every few weeks plus, for each computed as_of, rows only for bonds
+-- whose metrics changed. bond_metrics_as_of(d) rebuilds the full table for a computed
+-- date from the latest snapshot <= d and the latest change per bond since that snapshot.
+-- Like bond_risk_metrics, a date that was never computed returns no rows; pass
+-- carry_forward => TRUE to get the state in force on d instead (only up to the latest
+-- computed date, since nothing is known after it).
+
+BEGIN;
+
+-- one row per computed as_of (also dates where nothing changed)
+CREATE TABLE IF NOT EXISTS bond_metrics_history_runs (
+    as_of DATE PRIMARY KEY,
+    kind TEXT NOT NULL CHECK (kind IN ('snapshot', 'delta')),
+    bonds_written INT NOT NULL,
+    created_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+CREATE TABLE IF NOT EXISTS bond_metrics_snapshots (
+    snapshot_date DATE NOT NULL,
+    bond_id INT NOT NULL,
+    price NUMERIC(18,2),
+    macaulay_duration NUMERIC(12,4),
+    modified_duration NUMERIC(12,4),
+    convexity NUMERIC(14,4),
+    PRIMARY KEY (snapshot_date, bond_id)
+);
+
+-- new values for changed bonds; removed = bond no longer priced from this date
+CREATE TABLE IF NOT EXISTS bond_metrics_deltas (
+    as_of DATE NOT NULL,
+    bond_id INT NOT NULL,
+    price NUMERIC(18,2),
+    macaulay_duration NUMERIC(12,4),
+    modified_duration NUMERIC(12,4),
+    convexity NUMERIC(14,4),
+    removed BOOLEAN NOT NULL DEFAULT FALSE,
+    PRIMARY KEY (as_of, bond_id)
+);
+
+CREATE INDEX IF NOT EXISTS bond_metrics_deltas_bond_idx ON bond_metrics_deltas (bond_id, as_of DESC);
+
+-- same columns as bond_risk_metrics for one as_of
+CREATE OR REPLACE FUNCTION bond_metrics_as_of(d DATE, carry_forward BOOLEAN DEFAULT FALSE)
+RETURNS TABLE (
+    bond_id INT,
+    as_of DATE,
+    price NUMERIC,
+    macaulay_duration NUMERIC,
+    modified_duration NUMERIC,
+    convexity NUMERIC
+)
+LANGUAGE sql STABLE AS $$
+    WITH runs AS (
+        SELECT MAX(r.as_of) AS last_run, COALESCE(bool_or(r.as_of = d), FALSE) AS is_run
+        FROM bond_metrics_history_runs r
+    ),
+    snap AS (
+        SELECT MAX(snapshot_date) AS sd FROM bond_metrics_snapshots WHERE snapshot_date <= d
+    ),
+    base AS (
+        SELECT s.bond_id, s.price, s.macaulay_duration, s.modified_duration, s.convexity
+        FROM bond_metrics_snapshots s, snap
+        WHERE s.snapshot_date = snap.sd
+    ),
+    latest AS (
+        SELECT DISTINCT ON (x.bond_id)
+               x.bond_id, x.price, x.macaulay_duration, x.modified_duration, x.convexity, x.removed
+        FROM bond_metrics_deltas x, snap
+        WHERE x.as_of > COALESCE(snap.sd, '-infinity'::date) AND x.as_of <= d
+        ORDER BY x.bond_id, x.as_of DESC
+    )
+    SELECT COALESCE(l.bond_id, b.bond_id), d,
+           CASE WHEN l.bond_id IS NULL THEN b.price ELSE l.price END,
+           CASE WHEN l.bond_id IS NULL THEN b.macaulay_duration ELSE l.macaulay_duration END,
+           CASE WHEN l.bond_id IS NULL THEN b.modified_duration ELSE l.modified_duration END,
+           CASE WHEN l.bond_id IS NULL THEN b.convexity ELSE l.convexity END
+    FROM base b
+    FULL JOIN latest l ON l.bond_id = b.bond_id
+    CROSS JOIN runs
+    WHERE NOT COALESCE(l.removed, FALSE)
+      AND CASE WHEN carry_forward THEN d <= runs.last_run ELSE runs.is_run END;
+$$;
+
+COMMIT;
@@ -1,46 +1,57 @@
 # src/bond_analytics.py
 from datetime import date
-from src.utils.db import get_conn
-from src.utils.market_data import get_latest_curve, get_yield_curve, get_credit_spread
+from src.utils.market_data import get_bond_terms, get_latest_curve, get_yield_curve, get_credit_spread
+from src.utils.pricing_cache import cached
 import math
 
+EMPTY_METRICS = {
+    "price": 0.0,
+    "macaulay_duration": 0.0,
+    "modified_duration": 0.0,
+    "convexity": 0.0,
+    "cash_flows": []
+}
+
+
 def price_and_duration(bond_id: int, as_of: date):
     """
     Returns dict with price, macaulay duration, modified duration, convexity, and cash_flows.
     """
-    with get_conn() as conn:
-        with conn.cursor() as cur:
-            cur.execute("""
-                SELECT issue_date, maturity_date, coupon_rate, coupon_frequency,
-                       face_value, credit_rating
-                FROM bonds
-                WHERE bond_id = %s;
-            """, (bond_id,))
-            bond = cur.fetchone()
+    bond = get_bond_terms(bond_id)
 
     if not bond:
         raise ValueError(f"No bond found with id {bond_id}")
 
     issue_date, maturity_date, coupon_rate, freq, face_value, rating = bond
-    coupon_rate = float(coupon_rate)
-    face_value = float(face_value)
     spread = float(get_credit_spread(rating) or 0.0)
 
     # If bond has matured before as_of date
     if maturity_date <= as_of:
-        return {
-            "price": 0.0,
-            "macaulay_duration": 0.0,
-            "modified_duration": 0.0,
-            "convexity": 0.0,
-            "cash_flows": []
-        }
+        return dict(EMPTY_METRICS, cash_flows=[])
 
     curve_date = get_latest_curve(as_of)
     if not curve_date:
         raise ValueError(f"No yield curve available before {as_of}")
     curve = [(yr, float(yld)) for yr, yld in get_yield_curve(curve_date)]
 
+    # lookups are always fresh; the result is cached under a hash of exactly these inputs
+    return cached_price_from_terms(maturity_date, coupon_rate, freq, face_value, as_of, curve, spread)
+
+
+def price_from_terms(maturity_date: date, coupon_rate, freq: int, face_value, as_of: date,
+                     curve: list, spread: float):
+    """
+    Pure pricing from bond terms, no DB access (batch callers fetch curve / spreads once).
+    curve: [(years, yield), ...] sorted by years; spread in decimal form.
+    Same result dict as price_and_duration.
+    """
+    coupon_rate = float(coupon_rate)
+    face_value = float(face_value)
+
+    # If bond has matured before as_of date
+    if maturity_date <= as_of:
+        return dict(EMPTY_METRICS, cash_flows=[])
+
     # Generate cash flows
     years = (maturity_date - as_of).days / 365.0
     coupon = face_value * (coupon_rate / freq)
@@ -67,13 +78,7 @@ def price_and_duration(bond_id: int, as_of: date):
         convexity_sum += (t**2) * pv
 
     if price <= 0:
-        return {
-            "price": 0.0,
-            "macaulay_duration": 0.0,
-            "modified_duration": 0.0,
-            "convexity": 0.0,
-            "cash_flows": []
-        }
+        return dict(EMPTY_METRICS, cash_flows=[])
 
 
     macaulay_duration = weighted_sum / price
@@ -89,6 +94,8 @@ def price_and_duration(bond_id: int, as_of: date):
                        for t, cf in cash_flows]
     }
 
+cached_price_from_terms = cached("bond_analytics.price_from_terms")(price_from_terms)
+
 if __name__ == "__main__":
     result = price_and_duration(1, date(2025, 7, 20))
     print(result)
@@ -2,10 +2,19 @@
 from datetime import date
 from src.utils.db import get_conn
 from src.bond_analytics import price_and_duration
+from src.config import METRICS_STORAGE
+from src.metrics_history import store_history
 
 AS_OF_DATE = date(2025, 7, 20)  # you can change this dynamically if needed
 
-def compute_and_store_metrics(as_of=AS_OF_DATE):
+def compute_and_store_metrics(as_of=AS_OF_DATE, storage=METRICS_STORAGE):
+    """
+    storage="full": upsert one bond_risk_metrics row per bond.
+    storage="history": store only what changed since the last stored date (src/metrics_history.py).
+    """
+    if storage == "history":
+        return compute_and_store_history(as_of)
+
     with get_conn() as conn:
         with conn.cursor() as cur:
             # Fetch all bond IDs
@@ -37,6 +46,24 @@ def compute_and_store_metrics(as_of=AS_OF_DATE):
                     print(f"Error processing bond {bond_id}: {e}")
             conn.commit()
 
+def compute_and_store_history(as_of=AS_OF_DATE):
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT bond_id FROM bonds ORDER BY bond_id;")
+            bond_ids = [row[0] for row in cur.fetchall()]
+
+    rows = []
+    for bond_id in bond_ids:
+        try:
+            m = price_and_duration(bond_id, as_of)
+            rows.append((bond_id, m['price'], m['macaulay_duration'], m['modified_duration'], m['convexity']))
+        except Exception as e:
+            print(f"Error processing bond {bond_id}: {e}")
+
+    kind, written = store_history(as_of, rows)
+    print(f"History {kind} for {as_of}: {written} of {len(rows)} bonds written.")
+    return kind, written
+
 if __name__ == "__main__":
     compute_and_store_metrics()
     print(f"Metrics computed and stored for {AS_OF_DATE}.")
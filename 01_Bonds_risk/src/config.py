@@ -14,3 +14,17 @@ DB_CONFIG = {
 
 # A random seed for reproducibility
 RANDOM_SEED = 42
+
+# Pricing cache (src/utils/pricing_cache.py): per-process LRU + host-wide sqlite file
+# for pricing results, keyed by their inputs (bond terms, curve points, spread, as_of)
+PRICING_CACHE_ENABLED = os.getenv("PRICING_CACHE_ENABLED", "1") not in ("0", "false", "False")
+PRICING_CACHE_PATH = os.getenv(
+    "PRICING_CACHE_PATH", os.path.join(os.path.expanduser("~"), ".cache", "bond_risk_lab", "pricing_cache.sqlite")
+)
+PRICING_CACHE_MAX_MB = int(os.getenv("PRICING_CACHE_MAX_MB", 256))
+PRICING_CACHE_MEMORY_ITEMS = int(os.getenv("PRICING_CACHE_MEMORY_ITEMS", 50_000))
+
+# bond_risk_metrics storage: "full" (one row per bond per as_of) or
+# "history" (periodic snapshots + changed bonds only, src/metrics_history.py)
+METRICS_STORAGE = os.getenv("METRICS_STORAGE", "full")
+METRICS_SNAPSHOT_DAYS = int(os.getenv("METRICS_SNAPSHOT_DAYS", 30))
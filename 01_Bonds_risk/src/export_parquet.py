@@ -0,0 +1,74 @@
+# src/export_parquet.py
+# bond_risk_metrics -> partitioned Parquet for BI (Power BI / Excel)
+# Writes 02_data_clean/parquet/bond_risk_metrics/as_of=YYYY-MM-DD/part-0.parquet plus
+# _manifest.json via risklab_common.parquet_export (shared with 02_bank_stress_lab).
+# Dates from the latest exported one on are fingerprinted and rewritten if new or changed
+# (row count / checksum vs the manifest); use --since after correcting older dates.
+# With METRICS_STORAGE=history those dates are rebuilt through bond_metrics_as_of(), so
+# the files look the same whichever storage is in use.
+# risklab_common lives at the repo root, which must be on PYTHONPATH:
+#   PYTHONPATH=.. python -m src.export_parquet
+
+import argparse
+from datetime import date
+from pathlib import Path
+
+import pyarrow as pa
+
+from risklab_common.parquet_export import export_table
+
+from src.utils.db import get_conn
+from src.config import METRICS_STORAGE
+
+TABLE = "bond_risk_metrics"
+EXPORT_ROOT = Path(__file__).resolve().parents[1] / "02_data_clean" / "parquet"
+
+SCHEMA = pa.schema([
+    pa.field("as_of", pa.date32(), nullable=False),
+    pa.field("bond_id", pa.int32(), nullable=False),
+    pa.field("isin", pa.string()),
+    pa.field("credit_rating", pa.string()),
+    pa.field("price", pa.float64()),
+    pa.field("macaulay_duration", pa.float64()),
+    pa.field("modified_duration", pa.float64()),
+    pa.field("convexity", pa.float64()),
+])
+
+# isin / rating joined in so BI files don't need a second lookup against bonds
+BASE_SQL = """
+    SELECT m.as_of, m.bond_id, b.isin, b.credit_rating, m.price::float8 AS price,
+           m.macaulay_duration::float8 AS macaulay_duration,
+           m.modified_duration::float8 AS modified_duration, m.convexity::float8 AS convexity
+    FROM bond_risk_metrics m
+    LEFT JOIN bonds b ON b.bond_id = m.bond_id
+"""
+
+# history storage: one reconstruction per computed date (the exporter's as_of filters are
+# pushed down to bond_metrics_history_runs, so only the checked dates are rebuilt)
+HISTORY_BASE_SQL = """
+    SELECT r.as_of, m.bond_id, b.isin, b.credit_rating, m.price::float8 AS price,
+           m.macaulay_duration::float8 AS macaulay_duration,
+           m.modified_duration::float8 AS modified_duration, m.convexity::float8 AS convexity
+    FROM bond_metrics_history_runs r
+    CROSS JOIN LATERAL bond_metrics_as_of(r.as_of) m
+    LEFT JOIN bonds b ON b.bond_id = m.bond_id
+"""
+
+
+def export_bond_metrics(root=EXPORT_ROOT, since: date = None) -> list:
+    """
+    Export every new or changed as_of in bond_risk_metrics under root/bond_risk_metrics.
+    since: also re-export dates >= since regardless of the manifest.
+    Returns the list of exported dates.
+    """
+    base_sql = HISTORY_BASE_SQL if METRICS_STORAGE == "history" else BASE_SQL
+    return export_table(get_conn, TABLE, base_sql, SCHEMA, root, since)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export bond_risk_metrics to partitioned Parquet.")
+    parser.add_argument("--out", default=str(EXPORT_ROOT), help="export root directory")
+    parser.add_argument("--since", type=date.fromisoformat, help="re-export as_of dates on or after YYYY-MM-DD")
+    args = parser.parse_args()
+    exported = export_bond_metrics(args.out, args.since)
+    print(f"✅ Exported {len(exported)} as_of partition(s) of {TABLE} to {Path(args.out) / TABLE}")
@@ -0,0 +1,206 @@
+# src/fast_reprice.py
+# Approximate scenario repricing from stored bond_risk_metrics.
+# Under continuous compounding (bond_analytics convention) a parallel shift dy gives
+#   P(dy) ~= P * (1 - D*dy + 0.5*C*dy^2)
+# with D = Macaulay duration and C = convexity. The Taylor remainder is bounded by
+#   |err| <= P * T * C * |dy|^3 / 6 * exp(T * max(0, -dy))        (T = years to maturity)
+# since sum(t^3 * pv) <= T * sum(t^2 * pv). The stored inputs are rounded (price to 0.01,
+# duration / convexity to 1e-4), and a full repricing is reported to 0.01 as well, so the
+# bound also carries that rounding error
+#   0.005 * (1 + |1 - D*dy + 0.5*C*dy^2|) + P * 5e-5 * (|dy| + 0.5*dy^2)
+# Bonds whose bound exceeds the tolerance (long maturities, big shocks) are repriced in
+# full from their cash flows, vectorised across bonds; the rest cost a few vector ops.
+#
+# Key-rate shocks ({tenor_years: bps}) use krd_<N>y columns of bond_risk_metrics if they
+# exist (share of Macaulay duration from cash flows in each curve bucket). Without them a
+# non-parallel shock cannot be bounded, so those bonds are repriced in full.
+
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from src.utils.db import get_conn
+from src.config import METRICS_STORAGE
+from src.utils.market_data import get_latest_curve, get_yield_curve, get_credit_spreads
+
+REL_TOLERANCE = 1e-3        # max error bound as a fraction of price (10bp of price) before full repricing
+PRICE_ROUNDING = 0.005      # half a cent: stored price is rounded to 2 decimals
+METRIC_ROUNDING = 5e-5      # stored duration / convexity are rounded to 4 decimals
+KRD_PREFIX = "krd_"         # krd_1y, krd_2y, ... (one per curve tenor)
+
+
+def krd_columns(cur) -> list:
+    """krd_<N>y columns present on bond_risk_metrics, ordered by tenor."""
+    cur.execute("""
+        SELECT column_name FROM information_schema.columns
+        WHERE table_name = 'bond_risk_metrics' AND column_name LIKE %s;
+    """, (KRD_PREFIX + "%",))
+    cols = [r[0] for r in cur.fetchall()]
+    return sorted(cols, key=krd_tenor)
+
+
+def krd_tenor(col: str) -> int:
+    return int(col[len(KRD_PREFIX):].rstrip("y"))
+
+
+def load_book(as_of: date) -> pd.DataFrame:
+    """Bond terms + stored metrics for as_of (one row per bond with metrics)."""
+    with get_conn() as conn:
+        if METRICS_STORAGE == "history":
+            # history storage keeps price / duration / convexity only (no key-rate columns)
+            krds, source, where = [], "bond_metrics_as_of(%s) m", ""
+        else:
+            with conn.cursor() as cur:
+                krds = krd_columns(cur)
+            source, where = "bond_risk_metrics m", "WHERE m.as_of = %s"
+        extra = "".join(f", m.{c}" for c in krds)
+        df = pd.read_sql(
+            f"""
+            SELECT b.bond_id, b.maturity_date, b.coupon_rate, b.coupon_frequency, b.face_value,
+                   b.credit_rating, m.price, m.macaulay_duration, m.convexity{extra}
+            FROM {source}
+            JOIN bonds b ON b.bond_id = m.bond_id
+            {where}
+            ORDER BY b.bond_id;
+            """,
+            conn,
+            params=[as_of],
+        )
+    num_cols = ["coupon_rate", "face_value", "price", "macaulay_duration", "convexity"] + krds
+    df[num_cols] = df[num_cols].apply(pd.to_numeric, errors="coerce")
+    df["years"] = (pd.to_datetime(df["maturity_date"]) - pd.Timestamp(as_of)).dt.days.clip(lower=0) / 365.0
+    return df
+
+
+def taylor_reprice(price, duration, convexity, years, dy):
+    """
+    Vectorised second-order repricing for a parallel shift dy (decimal, scalar or per bond).
+    Returns (approx_price, error_bound) arrays.
+    """
+    price, duration, convexity, years = (np.asarray(a, dtype=float) for a in (price, duration, convexity, years))
+    dy = np.asarray(dy, dtype=float)
+    factor = 1.0 - duration * dy + 0.5 * convexity * dy * dy
+    approx = price * factor
+    bound = (price * years * convexity * np.abs(dy) ** 3 / 6.0 * np.exp(years * np.maximum(0.0, -dy))
+             + rounding_bound(price, factor, np.abs(dy), np.abs(dy) ** 2))
+    return approx, bound
+
+
+def rounding_bound(price, factor, dur_shift, conv_shift):
+    # error carried in from the stored (rounded) inputs,
+    #   |dP * factor| + P * (|dD| * dur_shift + 0.5 * |dC| * conv_shift)
+    # with dur_shift >= |first-order shift| and conv_shift >= dy^2, plus the rounding of
+    # the exact price it is compared with
+    return (PRICE_ROUNDING * (1.0 + np.abs(factor))
+            + np.abs(price) * METRIC_ROUNDING * (dur_shift + 0.5 * conv_shift))
+
+
+def taylor_reprice_krd(price, duration, convexity, years, krd, dy_k):
+    """
+    Key-rate version: krd (bonds x tenors) durations, dy_k (tenors,) shocks.
+    First order is exact per bucket; second order uses the duration-weighted shock, and the
+    bound adds the worst case of that simplification (0.5 * C * P * max(m^2 - dy_eff^2, dy_eff^2)).
+    """
+    price, duration, convexity, years = (np.asarray(a, dtype=float) for a in (price, duration, convexity, years))
+    krd, dy_k = np.asarray(krd, dtype=float), np.asarray(dy_k, dtype=float)
+    first = krd @ dy_k
+    dy_eff = np.divide(first, duration, out=np.zeros_like(first), where=duration > 0)
+    factor = 1.0 - first + 0.5 * convexity * dy_eff ** 2
+    approx = price * factor
+    m, lo = np.abs(dy_k).max(), dy_k.min()
+    bound = (price * years * convexity * m ** 3 / 6.0 * np.exp(years * max(0.0, -lo))
+             + 0.5 * convexity * price * np.maximum(m * m - dy_eff ** 2, dy_eff ** 2)
+             + rounding_bound(price, factor, np.abs(dy_k).sum(), m * m))
+    return approx, bound
+
+
+def shocked_curve(curve: list, shock) -> list:
+    """Apply a parallel (bps) or {tenor_years: bps} shock to [(years, yield), ...]."""
+    if isinstance(shock, dict):
+        return [(yr, y + float(shock.get(yr, 0.0)) / 10000.0) for yr, y in curve]
+    return [(yr, y + float(shock) / 10000.0) for yr, y in curve]
+
+
+def full_reprice(rows: pd.DataFrame, as_of: date, curve: list, spreads: dict) -> np.ndarray:
+    """
+    Exact scenario prices for rows, same convention as bond_analytics.price_from_terms
+    (int(years * freq) flows at i / freq, step-function curve, continuous compounding),
+    computed for all bonds at once on a padded (bonds x max payments) grid.
+    """
+    if rows.empty:
+        return np.empty(0)
+    days = (pd.to_datetime(rows["maturity_date"]) - pd.Timestamp(as_of)).dt.days.to_numpy()
+    freq = rows["coupon_frequency"].to_numpy(dtype=float)
+    face = rows["face_value"].to_numpy(dtype=float)
+    coupon = face * rows["coupon_rate"].to_numpy(dtype=float) / freq
+    spread = rows["credit_rating"].map(spreads).fillna(0.0).to_numpy(dtype=float)
+    n_pay = np.where(days > 0, (days / 365.0 * freq).astype(int), 0)
+
+    i = np.arange(1, max(int(n_pay.max()), 1) + 1)
+    t = i[None, :] / freq[:, None]
+    live = i[None, :] <= n_pay[:, None]
+    cf = np.where(live, coupon[:, None], 0.0) + np.where(i[None, :] == n_pay[:, None], face[:, None], 0.0)
+
+    tenors = np.array([yr for yr, _ in curve], dtype=float)
+    ylds = np.array([y for _, y in curve], dtype=float)
+    y = ylds[np.minimum(np.searchsorted(tenors, t, side="left"), len(tenors) - 1)]
+    price = (cf * np.exp(-(y + spread[:, None]) * t)).sum(axis=1)
+    return np.where(price > 0, np.round(price, 2), 0.0)
+
+
+def reprice(book: pd.DataFrame, shock, as_of: date, rel_tolerance: float = REL_TOLERANCE,
+            curve: list = None, spreads: dict = None) -> pd.DataFrame:
+    """
+    Scenario prices for every bond in book (from load_book).
+    shock: parallel shift in bps, or {tenor_years: bps} for key-rate shocks.
+    Returns book's bond_id / price plus price_approx, error_bound, price_scenario and
+    method ('taylor' or 'full').
+    """
+    price = book["price"].to_numpy(dtype=float)
+    dur = book["macaulay_duration"].to_numpy(dtype=float)
+    conv = book["convexity"].to_numpy(dtype=float)
+    years = book["years"].to_numpy(dtype=float)
+
+    if isinstance(shock, dict) and len(set(shock.values())) == 1:
+        shock = next(iter(shock.values()))   # same bps everywhere == parallel
+
+    if not isinstance(shock, dict):
+        approx, bound = taylor_reprice(price, dur, conv, years, float(shock) / 10000.0)
+    else:
+        krds = [c for c in book.columns if c.startswith(KRD_PREFIX)]
+        if krds:
+            dy_k = np.array([float(shock.get(krd_tenor(c), 0.0)) / 10000.0 for c in krds])
+            approx, bound = taylor_reprice_krd(price, dur, conv, years, book[krds].to_numpy(dtype=float), dy_k)
+        else:
+            approx, bound = np.full_like(price, np.nan), np.full_like(price, np.inf)
+
+    # missing metrics -> NaN bound -> full repricing as well
+    needs_full = ~(bound <= rel_tolerance * np.abs(price))
+    scenario = approx.copy()
+    if needs_full.any():
+        if curve is None:
+            curve_date = get_latest_curve(as_of)
+            if not curve_date:
+                raise ValueError(f"No yield curve available before {as_of}")
+            curve = [(yr, float(yld)) for yr, yld in get_yield_curve(curve_date)]
+        spreads = spreads if spreads is not None else get_credit_spreads()
+        scenario[needs_full] = full_reprice(book.loc[needs_full], as_of, shocked_curve(curve, shock), spreads)
+
+    return pd.DataFrame({
+        "bond_id": book["bond_id"].to_numpy(),
+        "price": price,
+        "price_approx": approx,
+        "error_bound": bound,
+        "price_scenario": scenario,
+        "method": np.where(needs_full, "full", "taylor"),
+    })
+
+
+if __name__ == "__main__":
+    as_of = date(2025, 7, 20)
+    book = load_book(as_of)
+    for bps in (-100, 25, 200):
+        res = reprice(book, bps, as_of)
+        print(f"{bps:+} bps: book {res['price'].sum():,.2f} -> {res['price_scenario'].sum():,.2f} "
+              f"({(res['method'] == 'full').sum()} of {len(res)} bonds repriced in full)")
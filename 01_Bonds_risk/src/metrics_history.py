@@ -0,0 +1,129 @@
+# src/metrics_history.py
+# History storage for bond risk metrics (see 03_sql/04_create_bond_metrics_history.sql).
+# store_history() writes a full snapshot every METRICS_SNAPSHOT_DAYS and otherwise only
+# the bonds whose metrics differ from the previous stored state; load_metrics_as_of()
+# rebuilds a computed date through bond_metrics_as_of() (no rows for dates never
+# computed, as with bond_risk_metrics). Writes are append-only in date order
+# (re-running the latest date is fine), since a back-dated change would silently alter
+# every later date's reconstruction.
+
+from datetime import date
+
+from psycopg2.extras import execute_values
+
+from src.utils.db import get_conn
+from src.config import METRICS_SNAPSHOT_DAYS
+
+METRIC_COLS = ["price", "macaulay_duration", "modified_duration", "convexity"]
+DIGITS = 4                  # stored values are rounded to <= 4 decimals in bond_analytics
+
+# drop-in for "FROM bond_risk_metrics m WHERE m.as_of = %s"
+AS_OF_SQL = """
+    SELECT m.bond_id, m.as_of, m.price, m.macaulay_duration,
+           m.modified_duration, m.convexity
+    FROM bond_metrics_as_of(%s) m;
+"""
+
+
+def _key(values):
+    return tuple(None if v is None else round(float(v), DIGITS) for v in values)
+
+
+def load_state(cur, as_of: date) -> dict:
+    """{bond_id: (price, macaulay, modified, convexity)} reconstructed for a computed as_of."""
+    cur.execute("""
+        SELECT bond_id, price, macaulay_duration, modified_duration, convexity
+        FROM bond_metrics_as_of(%s);
+    """, (as_of,))
+    return {r[0]: _key(r[1:]) for r in cur.fetchall()}
+
+
+def load_metrics_as_of(as_of: date) -> list:
+    """[(bond_id, as_of, price, macaulay, modified, convexity), ...] for as_of."""
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute(AS_OF_SQL, (as_of,))
+            return cur.fetchall()
+
+
+def delta_rows(as_of: date, prev: dict, new: dict) -> list:
+    """
+    bond_metrics_deltas rows turning state prev into new (both {bond_id: _key(values)}):
+    changed or added bonds with their values, dropped bonds with removed=True.
+    """
+    out = [(as_of, b, *v, False) for b, v in sorted(new.items()) if prev.get(b) != v]
+    out += [(as_of, b, None, None, None, None, True) for b in sorted(prev.keys() - new.keys())]
+    return out
+
+
+def snapshot_due(as_of: date, last_snapshot: date, snapshot_days: int) -> bool:
+    return last_snapshot is None or (as_of - last_snapshot).days >= snapshot_days
+
+
+def _last_runs(cur):
+    cur.execute("""
+        SELECT MAX(as_of), MAX(as_of) FILTER (WHERE kind = 'snapshot')
+        FROM bond_metrics_history_runs;
+    """)
+    return cur.fetchone()
+
+
+def store_history(as_of: date, rows: list, snapshot_days: int = METRICS_SNAPSHOT_DAYS):
+    """
+    rows: [(bond_id, price, macaulay, modified, convexity), ...] for the full universe on as_of.
+    Returns (kind, bonds_written) with kind 'snapshot' or 'delta'.
+    """
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            # serialise writers; the checks below assume nobody else appends meanwhile
+            cur.execute("LOCK TABLE bond_metrics_history_runs IN EXCLUSIVE MODE;")
+            last, last_snapshot = _last_runs(cur)
+            if last is not None and as_of < last:
+                raise ValueError(f"History is append-only: {as_of} is before latest stored date {last}")
+            if last == as_of:
+                # re-run of the latest date: replace it
+                cur.execute("DELETE FROM bond_metrics_snapshots WHERE snapshot_date = %s;", (as_of,))
+                cur.execute("DELETE FROM bond_metrics_deltas WHERE as_of = %s;", (as_of,))
+                cur.execute("DELETE FROM bond_metrics_history_runs WHERE as_of = %s;", (as_of,))
+                last, last_snapshot = _last_runs(cur)
+
+            new = {bond_id: _key(values) for bond_id, *values in rows}
+            if snapshot_due(as_of, last_snapshot, snapshot_days):
+                kind = "snapshot"
+                out = [(as_of, b, *v) for b, v in sorted(new.items())]
+                if out:
+                    execute_values(cur, f"""
+                        INSERT INTO bond_metrics_snapshots (snapshot_date, bond_id, {", ".join(METRIC_COLS)})
+                        VALUES %s;
+                    """, out, page_size=5000)
+            else:
+                kind = "delta"
+                out = delta_rows(as_of, load_state(cur, last), new)
+                if out:
+                    execute_values(cur, f"""
+                        INSERT INTO bond_metrics_deltas (as_of, bond_id, {", ".join(METRIC_COLS)}, removed)
+                        VALUES %s;
+                    """, out, page_size=5000)
+
+            cur.execute("""
+                INSERT INTO bond_metrics_history_runs (as_of, kind, bonds_written) VALUES (%s, %s, %s);
+            """, (as_of, kind, len(out)))
+        conn.commit()
+    return kind, len(out)
+
+
+def storage_summary():
+    """[(kind, runs, rows), ...] - how much the history actually stores."""
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT kind, COUNT(*), SUM(bonds_written)
+                FROM bond_metrics_history_runs
+                GROUP BY kind ORDER BY kind;
+            """)
+            return cur.fetchall()
+
+
+if __name__ == "__main__":
+    for kind, runs, n in storage_summary():
+        print(f"{kind:<9} runs={runs} rows={n}")
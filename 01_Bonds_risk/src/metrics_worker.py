@@ -0,0 +1,305 @@
+# src/metrics_worker.py
+# Distributed bond_risk_metrics computation with Postgres as the only coordinator.
+#   coordinator: enqueue(as_of) splits the bond universe into bond_id ranges (metrics_jobs)
+#   workers:     claim one job at a time (FOR UPDATE SKIP LOCKED), price the range with the
+#                curve / spreads fetched once, upsert bond_risk_metrics and mark the job done
+# Running jobs heartbeat; a job whose heartbeat is older than STALE_AFTER is reclaimed by
+# the next worker, or marked failed if its worker died on the last of MAX_ATTEMPTS. Results are only committed while the job is still ours, so a slow
+# worker whose job was reclaimed cannot overwrite it.
+#
+# Full storage only: history storage (METRICS_STORAGE=history) diffs the whole universe
+# for a date against the previous one, which bond_id-range jobs cannot do, so enqueue /
+# work refuse to run there; use compute_all_metrics instead.
+#
+#   python -m src.metrics_worker enqueue --as-of 2025-07-20
+#   python -m src.metrics_worker work            (run on as many hosts as needed)
+#   python -m src.metrics_worker local --as-of 2025-07-20 --workers 4
+
+import argparse
+import os
+import socket
+import threading
+import time
+from datetime import date
+from multiprocessing import Process
+
+from psycopg2.extras import execute_values
+
+from src.utils.db import get_conn
+from src.config import METRICS_STORAGE
+from src.utils.market_data import get_latest_curve, get_yield_curve, get_credit_spreads
+from src.bond_analytics import price_from_terms
+from src.compute_all_metrics import AS_OF_DATE
+
+CHUNK_SIZE = 500            # bonds per job
+HEARTBEAT_SECONDS = 10
+STALE_AFTER = 60            # seconds without heartbeat before a running job is reclaimed
+MAX_ATTEMPTS = 3
+POLL_SECONDS = 2
+
+
+def require_full_storage():
+    if METRICS_STORAGE != "full":
+        raise RuntimeError(
+            f"metrics_worker writes bond_risk_metrics directly, but METRICS_STORAGE={METRICS_STORAGE!r}; "
+            "run src.compute_all_metrics (which stores history) instead"
+        )
+
+
+# ------------------------------------------------------------------
+# Coordinator
+# ------------------------------------------------------------------
+def enqueue(as_of: date = AS_OF_DATE, chunk_size: int = CHUNK_SIZE, reset: bool = False) -> int:
+    """
+    Split bonds into bond_id ranges of ~chunk_size bonds and queue one job per range.
+    Existing jobs for the same range are left alone unless reset=True (back to pending).
+    Returns number of jobs inserted / reset.
+    """
+    require_full_storage()
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT bond_id FROM bonds ORDER BY bond_id;")
+            bond_ids = [r[0] for r in cur.fetchall()]
+            ranges = [(as_of, bond_ids[i], bond_ids[min(i + chunk_size, len(bond_ids)) - 1])
+                      for i in range(0, len(bond_ids), chunk_size)]
+            conflict = ("DO UPDATE SET status = 'pending', worker_id = NULL, heartbeat_at = NULL, "
+                        "attempts = 0, error = NULL, started_at = NULL, finished_at = NULL"
+                        if reset else "DO NOTHING")
+            execute_values(cur, f"""
+                INSERT INTO metrics_jobs (as_of, bond_id_lo, bond_id_hi)
+                VALUES %s
+                ON CONFLICT (as_of, bond_id_lo, bond_id_hi) {conflict};
+            """, ranges)
+            n = cur.rowcount
+        conn.commit()
+    return n
+
+
+def job_status(as_of: date = None):
+    """[(as_of, status, jobs, bonds_priced), ...]"""
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT as_of, status, COUNT(*), COALESCE(SUM(bonds_priced), 0)
+                FROM metrics_jobs
+                WHERE %(as_of)s::date IS NULL OR as_of = %(as_of)s
+                GROUP BY as_of, status
+                ORDER BY as_of, status;
+            """, {"as_of": as_of})
+            return cur.fetchall()
+
+
+# ------------------------------------------------------------------
+# Worker
+# ------------------------------------------------------------------
+CLAIM_SQL = """
+    UPDATE metrics_jobs
+    SET status = 'running', worker_id = %(worker)s, heartbeat_at = NOW(),
+        started_at = NOW(), finished_at = NULL, attempts = attempts + 1
+    WHERE job_id = (
+        SELECT job_id FROM metrics_jobs
+        WHERE attempts < %(max_attempts)s
+          AND (status IN ('pending', 'failed')
+               OR (status = 'running' AND heartbeat_at < NOW() - make_interval(secs => %(stale)s)))
+        ORDER BY job_id
+        FOR UPDATE SKIP LOCKED
+        LIMIT 1
+    )
+    RETURNING job_id, as_of, bond_id_lo, bond_id_hi;
+"""
+
+# stale running jobs that used their last attempt would never be claimed again
+EXPIRE_SQL = """
+    UPDATE metrics_jobs
+    SET status = 'failed', finished_at = NOW(),
+        error = 'worker ' || COALESCE(worker_id, '?') || ' stopped heartbeating on attempt ' || attempts
+    WHERE status = 'running'
+      AND attempts >= %(max_attempts)s
+      AND heartbeat_at < NOW() - make_interval(secs => %(stale)s);
+"""
+
+UPSERT_SQL = """
+    INSERT INTO bond_risk_metrics
+    (bond_id, as_of, price, macaulay_duration, modified_duration, convexity)
+    VALUES %s
+    ON CONFLICT (bond_id, as_of)
+    DO UPDATE SET
+        price = EXCLUDED.price,
+        macaulay_duration = EXCLUDED.macaulay_duration,
+        modified_duration = EXCLUDED.modified_duration,
+        convexity = EXCLUDED.convexity;
+"""
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def claim_job(worker_id: str, stale_after: int = STALE_AFTER, max_attempts: int = MAX_ATTEMPTS):
+    """
+    Claim the next open job (or a stale running one). Returns (job_id, as_of, lo, hi) or None.
+    Stale jobs out of attempts are marked failed first.
+    """
+    params = {"worker": worker_id, "stale": stale_after, "max_attempts": max_attempts}
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute(EXPIRE_SQL, params)
+            if cur.rowcount:
+                print(f"❌ {cur.rowcount} stale job(s) out of attempts marked failed.")
+            cur.execute(CLAIM_SQL, params)
+            job = cur.fetchone()
+        conn.commit()
+    return job
+
+
+def _heartbeat(job_id: int, worker_id: str, stop: threading.Event, every: int = HEARTBEAT_SECONDS):
+    # own connection, so heartbeats commit while the pricing transaction is still open
+    with get_conn() as conn:
+        while not stop.wait(every):
+            with conn.cursor() as cur:
+                cur.execute("""
+                    UPDATE metrics_jobs SET heartbeat_at = NOW()
+                    WHERE job_id = %s AND worker_id = %s AND status = 'running';
+                """, (job_id, worker_id))
+                still_ours = cur.rowcount == 1
+            conn.commit()
+            if not still_ours:
+                return
+
+
+_market_cache = {}
+
+
+def market_data(as_of: date):
+    """(curve, spreads) for as_of, fetched once per worker process."""
+    if as_of not in _market_cache:
+        curve_date = get_latest_curve(as_of)
+        if not curve_date:
+            raise ValueError(f"No yield curve available before {as_of}")
+        curve = [(yr, float(yld)) for yr, yld in get_yield_curve(curve_date)]
+        _market_cache[as_of] = (curve, get_credit_spreads())
+    return _market_cache[as_of]
+
+
+def price_range(cur, as_of: date, lo: int, hi: int):
+    """Price bonds with lo <= bond_id <= hi. Returns (rows for UPSERT_SQL, [(bond_id, error), ...])."""
+    curve, spreads = market_data(as_of)
+    cur.execute("""
+        SELECT bond_id, maturity_date, coupon_rate, coupon_frequency, face_value, credit_rating
+        FROM bonds
+        WHERE bond_id BETWEEN %s AND %s
+        ORDER BY bond_id;
+    """, (lo, hi))
+    rows, errors = [], []
+    for bond_id, maturity_date, coupon_rate, freq, face_value, rating in cur.fetchall():
+        try:
+            m = price_from_terms(maturity_date, coupon_rate, freq, face_value, as_of,
+                                 curve, spreads.get(rating, 0.0))
+            rows.append((bond_id, as_of, m["price"], m["macaulay_duration"],
+                         m["modified_duration"], m["convexity"]))
+        except Exception as e:
+            errors.append((bond_id, str(e)))
+    return rows, errors
+
+
+def process_job(job, worker_id: str) -> str:
+    """Price one claimed job. Returns 'done', 'failed', or 'reclaimed' (someone else took it meanwhile)."""
+    job_id, as_of, lo, hi = job
+    stop = threading.Event()
+    beat = threading.Thread(target=_heartbeat, args=(job_id, worker_id, stop), daemon=True)
+    beat.start()
+    try:
+        with get_conn() as conn:
+            try:
+                with conn.cursor() as cur:
+                    rows, errors = price_range(cur, as_of, lo, hi)
+                    if rows:
+                        execute_values(cur, UPSERT_SQL, rows, page_size=1000)
+                    # results and completion commit together, and only while the job is still ours
+                    cur.execute("""
+                        UPDATE metrics_jobs
+                        SET status = 'done', finished_at = NOW(), bonds_priced = %s, error = %s
+                        WHERE job_id = %s AND worker_id = %s AND status = 'running';
+                    """, (len(rows), "; ".join(f"bond {b}: {e}" for b, e in errors[:20]) or None,
+                          job_id, worker_id))
+                    if cur.rowcount != 1:
+                        conn.rollback()
+                        return "reclaimed"
+                conn.commit()
+            except Exception as e:
+                conn.rollback()
+                with conn.cursor() as cur:
+                    cur.execute("""
+                        UPDATE metrics_jobs SET status = 'failed', finished_at = NOW(), error = %s
+                        WHERE job_id = %s AND worker_id = %s;
+                    """, (str(e), job_id, worker_id))
+                conn.commit()
+                print(f"❌ Job {job_id} ({as_of}, bonds {lo}-{hi}) failed: {e}")
+                return "failed"
+    finally:
+        stop.set()
+        beat.join()
+    for bond_id, err in errors:
+        print(f"Error processing bond {bond_id}: {err}")
+    return "done"
+
+
+def run_worker(worker_id: str = None, exit_when_idle: bool = False, poll_seconds: float = POLL_SECONDS) -> int:
+    """Claim and process jobs until the queue is empty (exit_when_idle) or forever. Returns jobs done."""
+    require_full_storage()
+    worker_id = worker_id or default_worker_id()
+    done = 0
+    while True:
+        job = claim_job(worker_id)
+        if job is None:
+            if exit_when_idle:
+                return done
+            time.sleep(poll_seconds)
+            continue
+        status = process_job(job, worker_id)
+        if status == "done":
+            done += 1
+        elif status == "reclaimed":
+            print(f"⚠️ Job {job[0]} was reclaimed by another worker; results discarded.")
+
+
+def run_local(as_of: date = AS_OF_DATE, workers: int = 4, chunk_size: int = CHUNK_SIZE):
+    """Enqueue as_of and drain it with several local processes (same code path as multi-host)."""
+    enqueue(as_of, chunk_size)
+    procs = [Process(target=run_worker, kwargs={"exit_when_idle": True}) for _ in range(workers)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join()
+    return job_status(as_of)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Queue-based bond_risk_metrics computation.")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p_enq = sub.add_parser("enqueue", help="queue jobs for an as_of date")
+    p_enq.add_argument("--as-of", type=date.fromisoformat, default=AS_OF_DATE)
+    p_enq.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    p_enq.add_argument("--reset", action="store_true", help="re-queue ranges that already exist")
+
+    p_work = sub.add_parser("work", help="run a worker")
+    p_work.add_argument("--exit-when-idle", action="store_true")
+
+    p_local = sub.add_parser("local", help="enqueue and run N local worker processes")
+    p_local.add_argument("--as-of", type=date.fromisoformat, default=AS_OF_DATE)
+    p_local.add_argument("--workers", type=int, default=4)
+    p_local.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+
+    p_status = sub.add_parser("status", help="job counts by status")
+    p_status.add_argument("--as-of", type=date.fromisoformat)
+
+    args = parser.parse_args()
+    if args.cmd == "enqueue":
+        print(f"✅ {enqueue(args.as_of, args.chunk_size, args.reset)} jobs queued for {args.as_of}.")
+    elif args.cmd == "work":
+        print(f"✅ Worker finished {run_worker(exit_when_idle=args.exit_when_idle)} jobs.")
+    else:
+        rows = run_local(args.as_of, args.workers, args.chunk_size) if args.cmd == "local" else job_status(args.as_of)
+        for as_of, status, jobs, priced in rows:
+            print(f"{as_of} {status:<8} jobs={jobs} bonds={priced}")
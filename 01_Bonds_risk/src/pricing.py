@@ -1,7 +1,7 @@
 # src/pricing.py
 from datetime import date
-from src.utils.db import get_conn
-from src.utils.market_data import get_latest_curve, get_yield_curve, get_credit_spread
+from src.utils.market_data import get_bond_terms, get_latest_curve, get_yield_curve, get_credit_spread
+from src.utils.pricing_cache import cached
 import math
 
 def price_bond(bond_id: int, as_of: date):
@@ -10,15 +10,7 @@ def price_bond(bond_id: int, as_of: date):
     Assumes continuous compounding.
     """
     # 1. Fetch bond details
-    with get_conn() as conn:
-        with conn.cursor() as cur:
-            cur.execute("""
-                SELECT issue_date, maturity_date, coupon_rate, coupon_frequency,
-                       face_value, credit_rating
-                FROM bonds
-                WHERE bond_id = %s;
-            """, (bond_id,))
-            bond = cur.fetchone()
+    bond = get_bond_terms(bond_id)
 
     if not bond:
         raise ValueError(f"No bond found with id {bond_id}")
@@ -39,6 +31,13 @@ def price_bond(bond_id: int, as_of: date):
     # Credit spread
     spread = float(get_credit_spread(rating) or 0.0)
 
+    # Steps 3-4, cached under a hash of the terms, curve points, spread and as_of
+    return cached_price_from_curve(maturity_date, coupon_rate, freq, face_value, as_of, curve, spread)
+
+
+def price_from_curve(maturity_date: date, coupon_rate: float, freq: int, face_value: float,
+                     as_of: date, curve: list, spread: float):
+    """Steps 3-4 of price_bond on already-fetched inputs."""
     # 3. Generate cash flows
     cash_flows = []
     years = (maturity_date - as_of).days / 365.0
@@ -64,6 +63,8 @@ def price_bond(bond_id: int, as_of: date):
 
     return round(price, 2)
 
+cached_price_from_curve = cached("pricing.price_from_curve")(price_from_curve)
+
 if __name__ == "__main__":
     test_price = price_bond(1, date(2025, 7, 20))
     print(f"Bond 1 price: {test_price}")
@@ -3,6 +3,22 @@
 from .db import get_conn
 from datetime import date
 
+def get_bond_terms(bond_id: int):
+    """
+    Fetches (issue_date, maturity_date, coupon_rate, coupon_frequency, face_value, credit_rating)
+    for bond_id, or None if there is no such bond.
+    """
+    query = """
+        SELECT issue_date, maturity_date, coupon_rate, coupon_frequency,
+               face_value, credit_rating
+        FROM bonds
+        WHERE bond_id = %s;
+    """
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute(query, (bond_id,))
+            return cur.fetchone()
+
 def get_yield_curve(curve_date: date):
     """
     Fetches all tenor-yield pairs for the given curve_date.
@@ -49,6 +65,17 @@ def get_credit_spread(rating: str):
             row = cur.fetchone()
     return row[0] / 10000 if row else None
 
+def get_credit_spreads():
+    """
+    Returns {rating: spread} for all ratings, in decimal form (one query for batch pricing).
+    """
+    query = "SELECT rating, spread_bps FROM credit_spread;"
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute(query)
+            rows = cur.fetchall()
+    return {rating: float(bps) / 10000 for rating, bps in rows}
+
 if __name__ == "__main__":
     # Quick smoke test
     latest_date = get_latest_curve(date(2025, 7, 20))
@@ -0,0 +1,293 @@
+# src/utils/pricing_cache.py
+# Two-tier cache for pricing results (price_and_duration / price_bond), so every
+# dashboard session and batch job on a host shares one repricing per set of inputs.
+#   memory: per-process LRU (OrderedDict), bounded by entry count
+#   disk:   sqlite file (WAL) shared by every process on the host, bounded by bytes;
+#           least recently used entries are evicted when it grows past the limit
+# Keys are sha256 over the function namespace and its canonicalised arguments: bond terms,
+# the resolved curve points, spread and as_of. The Postgres lookups that produce those are
+# never cached, so a new curve, an edited bond or a changed spread is simply a new key and
+# entries never go stale (no TTL; size eviction drops the ones no longer asked for).
+# Reads never write: disk access times are batched and flushed with the next put (or every
+# TOUCH_FLUSH_EVERY hits). Bump CACHE_VERSION whenever a cached function's result changes.
+#
+# python -m src.utils.pricing_cache --bench  times cold vs cached price_and_duration.
+
+import argparse
+import functools
+import hashlib
+import inspect
+import json
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime
+from decimal import Decimal
+from pathlib import Path
+
+from src.config import PRICING_CACHE_ENABLED, PRICING_CACHE_MAX_MB, PRICING_CACHE_MEMORY_ITEMS, PRICING_CACHE_PATH
+
+CACHE_VERSION = 3
+EVICT_EVERY = 200           # disk puts between size checks
+EVICT_TO = 0.9              # evict down to this fraction of max size
+TOUCH_FLUSH_EVERY = 500     # disk hits between batched accessed_at updates
+ENABLED = PRICING_CACHE_ENABLED
+
+
+def _canonical(obj):
+    # stable JSON-able form; Decimal and float of the same value hash the same
+    if isinstance(obj, (Decimal, float)):
+        return repr(float(obj))
+    if isinstance(obj, (date, datetime)):
+        return obj.isoformat()
+    if isinstance(obj, dict):
+        return {str(k): _canonical(v) for k, v in sorted(obj.items(), key=lambda kv: str(kv[0]))}
+    if isinstance(obj, (list, tuple)):
+        return [_canonical(v) for v in obj]
+    if obj is None or isinstance(obj, (bool, int, str)):
+        return obj
+    return str(obj)
+
+
+def make_key(namespace: str, **parts) -> str:
+    payload = json.dumps([CACHE_VERSION, namespace, _canonical(parts)], separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class PricingCache:
+    def __init__(self, path=PRICING_CACHE_PATH, max_bytes=PRICING_CACHE_MAX_MB * 1024 * 1024,
+                 memory_items=PRICING_CACHE_MEMORY_ITEMS):
+        self.path = Path(path) if path else None
+        self.max_bytes = max_bytes
+        self.memory_items = memory_items
+        self._memory = OrderedDict()
+        self._lock = threading.RLock()
+        self._conn = None
+        self._conn_pid = None
+        self._puts = 0
+        self._touched = {}      # key -> last disk hit time, not yet written
+        self.hits = self.disk_hits = self.misses = 0
+
+    # --- disk tier -------------------------------------------------
+    def _db(self):
+        # one connection per process (sqlite connections must not cross a fork)
+        if self.path is None:
+            return None
+        if self._conn is None or self._conn_pid != os.getpid():
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL;")
+            conn.execute("PRAGMA synchronous=NORMAL;")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS pricing_cache (
+                    key TEXT PRIMARY KEY,
+                    value BLOB NOT NULL,
+                    size INTEGER NOT NULL,
+                    accessed_at REAL NOT NULL
+                );
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS pricing_cache_accessed_idx ON pricing_cache (accessed_at);")
+            conn.commit()
+            self._conn, self._conn_pid = conn, os.getpid()
+        return self._conn
+
+    def _disk_get(self, key):
+        # read only; the access time is remembered and written later in one batch
+        db = self._db()
+        if db is None:
+            return None
+        try:
+            row = db.execute("SELECT value FROM pricing_cache WHERE key = ?;", (key,)).fetchone()
+        except sqlite3.OperationalError:
+            # busy / read-only file: behave like a miss rather than failing the pricing call
+            return None
+        if row is None:
+            return None
+        self._touched[key] = time.time()
+        if len(self._touched) >= TOUCH_FLUSH_EVERY:
+            self._flush_touched()
+        return row[0]
+
+    def _flush_touched(self):
+        if not self._touched:
+            return
+        db = self._db()
+        try:
+            db.executemany("UPDATE pricing_cache SET accessed_at = ? WHERE key = ?;",
+                           [(t, k) for k, t in self._touched.items()])
+            db.commit()
+        except sqlite3.OperationalError:
+            pass    # only LRU order is lost
+        self._touched.clear()
+
+    def _disk_put(self, key, blob):
+        db = self._db()
+        if db is None:
+            return
+        try:
+            db.execute("INSERT OR REPLACE INTO pricing_cache (key, value, size, accessed_at) VALUES (?, ?, ?, ?);",
+                       (key, blob, len(blob), time.time()))
+            self._touched.pop(key, None)
+            db.commit()
+        except sqlite3.OperationalError:
+            return
+        self._flush_touched()
+        self._puts += 1
+        if self._puts % EVICT_EVERY == 0:
+            self.evict()
+
+    def evict(self):
+        """Drop least recently used disk entries until the file's payload is under EVICT_TO * max_bytes."""
+        db = self._db()
+        if db is None:
+            return 0
+        with self._lock:
+            self._flush_touched()
+            total = db.execute("SELECT COALESCE(SUM(size), 0) FROM pricing_cache;").fetchone()[0]
+            if total <= self.max_bytes:
+                return 0
+            excess = total - int(self.max_bytes * EVICT_TO)
+            cutoff = db.execute("""
+                SELECT accessed_at FROM (
+                    SELECT accessed_at, SUM(size) OVER (ORDER BY accessed_at, key) AS running
+                    FROM pricing_cache
+                ) WHERE running >= ? ORDER BY accessed_at LIMIT 1;
+            """, (excess,)).fetchone()
+            if cutoff is None:
+                return 0
+            n = db.execute("DELETE FROM pricing_cache WHERE accessed_at <= ?;", (cutoff[0],)).rowcount
+            db.commit()
+            return n
+
+    # --- public ----------------------------------------------------
+    def get(self, key):
+        """Cached value (a fresh copy) or None."""
+        with self._lock:
+            blob = self._memory.get(key)
+            if blob is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return pickle.loads(blob)
+            blob = self._disk_get(key)
+            if blob is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._remember(key, blob)
+        return pickle.loads(blob)
+
+    def put(self, key, value):
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._remember(key, blob)
+            self._disk_put(key, blob)
+
+    def _remember(self, key, blob):
+        self._memory[key] = blob
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._touched.clear()
+            db = self._db()
+            if db is not None:
+                db.execute("DELETE FROM pricing_cache;")
+                db.commit()
+
+    def stats(self):
+        return dict(hits=self.hits, disk_hits=self.disk_hits, misses=self.misses, memory_items=len(self._memory))
+
+
+_default_cache = None
+
+
+def get_cache() -> PricingCache:
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = PricingCache()
+    return _default_cache
+
+
+def cached(namespace: str):
+    """
+    Decorator: memoise a pure function through the default cache.
+    The key covers namespace + every bound argument (defaults included), so the
+    arguments must be everything the result depends on.
+    Exceptions and None results are not cached.
+    """
+    def decorator(func):
+        sig = inspect.signature(func)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return func(*args, **kwargs)
+            bound = sig.bind(*args, **kwargs)
+            bound.apply_defaults()
+            key = make_key(namespace, **bound.arguments)
+            cache = get_cache()
+            value = cache.get(key)
+            if value is None:
+                value = func(*args, **kwargs)
+                if value is not None:
+                    cache.put(key, value)
+            return value
+
+        wrapper.uncached = func
+        return wrapper
+    return decorator
+
+
+def bench(bond_ids, as_of, repeat=3):
+    """
+    Mean seconds per price_and_duration call: cache off, cold cache, warm cache.
+    A warm call still runs the Postgres lookups; only the pricing is served from cache.
+    """
+    global ENABLED
+    from src import bond_analytics
+
+    def timed(enabled):
+        global ENABLED
+        ENABLED = enabled
+        t0 = time.perf_counter()
+        for bond_id in bond_ids:
+            bond_analytics.price_and_duration(bond_id, as_of)
+        return (time.perf_counter() - t0) / len(bond_ids)
+
+    try:
+        off = min(timed(False) for _ in range(repeat))
+        get_cache().clear()
+        cold = timed(True)
+        warm = min(timed(True) for _ in range(repeat))
+    finally:
+        ENABLED = PRICING_CACHE_ENABLED
+    return dict(off=off, cold=cold, warm=warm)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pricing cache size / benchmark.")
+    parser.add_argument("--bench", action="store_true", help="time price_and_duration with and without the cache")
+    parser.add_argument("--bonds", type=int, default=200, help="bonds to price in the benchmark")
+    args = parser.parse_args()
+
+    c = get_cache()
+    if args.bench:
+        from src.utils.db import get_conn
+        from src.compute_all_metrics import AS_OF_DATE
+        with get_conn() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT bond_id FROM bonds ORDER BY bond_id LIMIT %s;", (args.bonds,))
+                ids = [r[0] for r in cur.fetchall()]
+        t = bench(ids, AS_OF_DATE)
+        print(f"price_and_duration over {len(ids)} bonds: cache off {t['off'] * 1e6:,.0f}µs, "
+              f"cold {t['cold'] * 1e6:,.0f}µs, warm {t['warm'] * 1e6:,.0f}µs per call "
+              f"({t['off'] / t['warm']:.1f}x)")
+    db = c._db()
+    n, size = db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM pricing_cache;").fetchone()
+    print(f"Pricing cache {c.path}: {n} entries, {size / 1024 / 1024:.2f} MB (limit {PRICING_CACHE_MAX_MB} MB)")
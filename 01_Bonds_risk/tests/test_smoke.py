@@ -0,0 +1,146 @@
+# Pure pricing checks (no database needed).
+from datetime import date, timedelta
+from decimal import Decimal
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.bond_analytics import price_from_terms
+from src import fast_reprice, metrics_history
+from src.utils import pricing_cache
+from src.utils.pricing_cache import PricingCache, make_key
+
+AS_OF = date(2025, 7, 20)
+CURVE = [(1, 0.040), (2, 0.041), (5, 0.043), (10, 0.045), (30, 0.047)]
+SPREADS = {"AAA": 0.005, "BBB": 0.020}
+
+
+def _book(n=200, seed=0):
+    rng = np.random.default_rng(seed)
+    rows = []
+    for bond_id in range(n):
+        maturity = AS_OF + timedelta(days=int(rng.integers(30, 30 * 365)))
+        coupon, freq = round(float(rng.uniform(0.0, 0.08)), 4), int(rng.choice([1, 2, 4]))
+        rating = str(rng.choice(list(SPREADS)))
+        m = price_from_terms(maturity, coupon, freq, 1000.0, AS_OF, CURVE, SPREADS[rating])
+        rows.append(dict(bond_id=bond_id, maturity_date=maturity, coupon_rate=coupon, coupon_frequency=freq,
+                         face_value=1000.0, credit_rating=rating, price=m["price"],
+                         macaulay_duration=m["macaulay_duration"], convexity=m["convexity"]))
+    book = pd.DataFrame(rows)
+    book["years"] = (pd.to_datetime(book["maturity_date"]) - pd.Timestamp(AS_OF)).dt.days.clip(lower=0) / 365.0
+    return book
+
+
+def _exact(book, bps):
+    curve = fast_reprice.shocked_curve(CURVE, bps)
+    return np.array([
+        price_from_terms(r.maturity_date, r.coupon_rate, r.coupon_frequency, r.face_value, AS_OF,
+                         curve, SPREADS[r.credit_rating])["price"]
+        for r in book.itertuples(index=False)
+    ])
+
+
+@pytest.mark.parametrize("bps", [-300, -100, -25, 25, 100, 300])
+def test_taylor_bound_covers_exact_reprice(bps):
+    book = _book()
+    approx, bound = fast_reprice.taylor_reprice(book["price"], book["macaulay_duration"], book["convexity"],
+                                                book["years"], bps / 10000.0)
+    assert (np.abs(approx - _exact(book, bps)) <= bound).all()
+
+
+@pytest.mark.parametrize("bps", [-100, 200])
+def test_vectorised_full_reprice_matches_price_from_terms(bps):
+    book = _book()
+    full = fast_reprice.full_reprice(book, AS_OF, fast_reprice.shocked_curve(CURVE, bps), SPREADS)
+    np.testing.assert_allclose(full, _exact(book, bps), atol=1e-9)
+
+
+def test_reprice_stays_within_tolerance():
+    book = _book()
+    res = fast_reprice.reprice(book, 100, AS_OF, curve=CURVE, spreads=SPREADS)
+    err = np.abs(res["price_scenario"] - _exact(book, 100))
+    assert (err <= fast_reprice.REL_TOLERANCE * res["price"] + 1e-9).all()
+    assert set(res["method"]) <= {"taylor", "full"}
+
+
+# ------------------------------------------------------------------
+# pricing cache
+# ------------------------------------------------------------------
+def test_cache_key_canonicalises_inputs():
+    key = make_key("p", coupon_rate=Decimal("0.05"), as_of=AS_OF, curve=CURVE, spread=0.005)
+    assert key == make_key("p", spread=Decimal("0.005"), curve=[list(p) for p in CURVE], as_of=AS_OF,
+                           coupon_rate=0.05)
+    assert make_key("p", terms={"a": 1, "b": 2}) == make_key("p", terms={"b": 2, "a": 1})
+    # any input that moves the price moves the key
+    moved = [(1, 0.040), (2, 0.041), (5, 0.043), (10, 0.045), (30, 0.048)]
+    assert key != make_key("p", coupon_rate=0.05, as_of=AS_OF, curve=moved, spread=0.005)
+    assert key != make_key("p", coupon_rate=0.05, as_of=AS_OF + timedelta(days=1), curve=CURVE, spread=0.005)
+    assert key != make_key("q", coupon_rate=0.05, as_of=AS_OF, curve=CURVE, spread=0.005)
+
+
+def test_memory_tier_is_lru():
+    cache = PricingCache(path=None, memory_items=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1          # a is now the most recent
+    cache.put("c", 3)
+    assert cache.get("b") is None and cache.get("a") == 1 and cache.get("c") == 3
+    value = {"cash_flows": [(1.0, 5.0, 4.8)]}
+    cache.put("d", value)
+    cache.get("d")["cash_flows"].clear()
+    assert cache.get("d") == value      # callers get copies
+
+
+def test_disk_tier_is_shared_and_evicts_least_recently_used(tmp_path, monkeypatch):
+    monkeypatch.setattr(pricing_cache, "EVICT_EVERY", 10 ** 9)
+    path = tmp_path / "cache.sqlite"
+    writer = PricingCache(path=path, max_bytes=10_000, memory_items=1)
+    blob = "x" * 1000
+    for i in range(12):
+        writer.put(f"k{i}", blob)
+    reader = PricingCache(path=path, memory_items=1)
+    assert reader.get("k0") == blob and reader.disk_hits == 1
+    reader._flush_touched()             # k0 is now the most recently used
+
+    assert writer.evict() > 0
+    db = writer._db()
+    left = {k for (k,) in db.execute("SELECT key FROM pricing_cache;")}
+    total = db.execute("SELECT SUM(size) FROM pricing_cache;").fetchone()[0]
+    assert total <= 10_000 * pricing_cache.EVICT_TO
+    assert "k0" in left and "k1" not in left and "k11" in left
+
+
+def test_cached_reprices_only_new_inputs(tmp_path, monkeypatch):
+    calls = []
+    monkeypatch.setattr(pricing_cache, "ENABLED", True)
+    monkeypatch.setattr(pricing_cache, "_default_cache", PricingCache(path=tmp_path / "c.sqlite"))
+    priced = pricing_cache.cached("test.price")(lambda curve, spread: calls.append(1) or price_from_terms(
+        AS_OF + timedelta(days=3650), 0.05, 2, 1000.0, AS_OF, curve, spread))
+    first = priced(CURVE, 0.005)
+    assert priced([tuple(p) for p in CURVE], Decimal("0.005")) == first and len(calls) == 1
+    priced(fast_reprice.shocked_curve(CURVE, 10), 0.005)     # new curve: new key, repriced
+    assert len(calls) == 2
+
+
+# ------------------------------------------------------------------
+# metrics history
+# ------------------------------------------------------------------
+def test_snapshot_cadence():
+    assert metrics_history.snapshot_due(AS_OF, None, 7)
+    assert not metrics_history.snapshot_due(AS_OF, AS_OF - timedelta(days=6), 7)
+    assert metrics_history.snapshot_due(AS_OF, AS_OF - timedelta(days=7), 7)
+
+
+def test_delta_rows_keep_only_changes():
+    key = metrics_history._key
+    prev = {1: key([Decimal("101.25"), 4.1, 4.1, 20.0]), 2: key([99.0, 2.0, 2.0, 5.0]), 3: key([50.0, 1.0, 1.0, 1.0])}
+    new = {1: key([101.25000001, 4.1, 4.1, 20.0]),          # same after rounding: not written
+           2: key([98.5, 2.0, 2.0, 5.0]),                   # changed
+           4: key([100.0, 3.0, 3.0, 9.0])}                  # new bond; bond 3 dropped
+    assert metrics_history.delta_rows(AS_OF, prev, new) == [
+        (AS_OF, 2, 98.5, 2.0, 2.0, 5.0, False),
+        (AS_OF, 4, 100.0, 3.0, 3.0, 9.0, False),
+        (AS_OF, 3, None, None, None, None, True),
+    ]
+    assert metrics_history.delta_rows(AS_OF, prev, prev) == []
@@ -1,73 +1,137 @@
 # create banks + loans
-import random
+# Each (loan_date, bank) shard draws from its own seeded stream, so the loan book is
+# identical whatever the worker count or start date. Workers stream whole days into
+# loan_portfolio with COPY over one connection each, and refresh that day's
+# loan_daily_rollup rows in the same transaction.
+import io
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
+from functools import partial
+
+import numpy as np
 from analytics.db import get_conn
-from psycopg2.extras import execute_values
+from analytics.partitions import ensure_partitions
+from analytics.rollups import refresh_rollup_days
 
 RANDOM_SEED = 42
-random.seed(RANDOM_SEED)
 
 START_DATE = datetime(2025, 7, 1)
 NUM_DAYS = 90
 LOANS_PER_BANK_PER_DAY = 50
+DEFAULT_PROB = 0.05
+NUM_WORKERS = 4
 
 SPIKE_PROB_PER_DAY = 0.2 #20% chance that a bank has a spike that day
 SPIKE_MULTIPLIER_RANGE = (2,5) # Multiplier range (eg, 2x to 5x loans)
 
+SEG_CODES = ['Retail', 'Corporate', 'SME', 'Agri', 'Mortgage']
+
+COPY_SQL = """
+    COPY loan_portfolio (bank_id, orig_amt, current_bal, default_flag, risk_weight, seg_code, loan_date)
+    FROM STDIN WITH (FORMAT csv)
+"""
+
+_worker_conn = None # one connection per worker process
+
 def fetch_banks():
     sql = "SELECT bank_id , bank_name FROM banks ORDER by bank_id;"
     with get_conn() as conn:
         with conn.cursor() as cur:
             cur.execute(sql)
             return cur.fetchall()
-        
-def generate_loans_for_day(bank_id, loan_date, n_loans = LOANS_PER_BANK_PER_DAY, default_prob = 0.05):
-    rows = []
-    #we'll fill rows with tuples
-    seg_codes = ['Retail', 'Corporate', 'SME', 'Agri', 'Mortgage']
-    for _ in range(n_loans):
-        orig_amt = random.uniform(10000, 5000000)
-        current_bal = orig_amt * random.uniform(0.5, 1.0)
-        default_flag = random.random() < default_prob
-        risk_weight = 1.0 if default_flag else 0.5
-        seg_code = random.choice(seg_codes)
-        rows.append((bank_id, orig_amt, current_bal, default_flag, risk_weight, seg_code, loan_date))
-    return rows
-
-def bulk_insert_loans(rows):
-    sql = """
-          INSERT INTO loan_portfolio
-          (bank_id, orig_amt, current_bal, default_flag, risk_weight, seg_code, loan_date)
-          VALUES %s
-          """
-    
-    with get_conn() as conn:
-        with conn.cursor() as cur:
-            execute_values(cur, sql, rows)
 
-def simulate_loans_for_all_days():
+def shard_rng(loan_date, bank_id, seed = RANDOM_SEED):
+    # independent stream keyed by the calendar date (not the offset from start_date) and bank,
+    # so a given loan_date always gets the same loans whatever range it is generated in
+    return np.random.default_rng(np.random.SeedSequence(seed, spawn_key = (loan_date.toordinal(), bank_id)))
+
+def generate_shard(bank_id, loan_date, seed = RANDOM_SEED, n_loans = None, default_prob = DEFAULT_PROB):
+    rng = shard_rng(loan_date, bank_id, seed)
+
+    #Determine if today is a spike day for this bank
+    multiplier = 1
+    if n_loans is None:
+        if rng.random() < SPIKE_PROB_PER_DAY:
+            multiplier = int(rng.integers(SPIKE_MULTIPLIER_RANGE[0], SPIKE_MULTIPLIER_RANGE[1] + 1))
+        n_loans = LOANS_PER_BANK_PER_DAY * multiplier
+
+    orig_amt = rng.uniform(10000, 5000000, n_loans)
+    current_bal = orig_amt * rng.uniform(0.5, 1.0, n_loans)
+    default_flag = rng.random(n_loans) < default_prob
+    return dict(
+        bank_id = bank_id,
+        loan_date = loan_date,
+        multiplier = multiplier,
+        orig_amt = orig_amt,
+        current_bal = current_bal,
+        default_flag = default_flag,
+        risk_weight = np.where(default_flag, 1.0, 0.5),
+        seg_idx = rng.integers(0, len(SEG_CODES), n_loans),
+    )
+
+def write_shard_csv(shard, buf):
+    bank_id, loan_date = shard["bank_id"], shard["loan_date"].isoformat()
+    segs = np.asarray(SEG_CODES)[shard["seg_idx"]].tolist()
+    flags = np.where(shard["default_flag"], "t", "f").tolist()
+    buf.writelines(
+        f"{bank_id},{o:.2f},{c:.2f},{f},{w},{s},{loan_date}\n"
+        for o, c, f, w, s in zip(shard["orig_amt"].tolist(), shard["current_bal"].tolist(),
+                                 flags, shard["risk_weight"].tolist(), segs)
+    )
+
+def _init_worker():
+    global _worker_conn
+    _worker_conn = get_conn()
+
+def load_day(day, bank_ids, start_date = START_DATE, seed = RANDOM_SEED):
+    loan_date = (start_date + timedelta(days = day)).date()
+    buf = io.StringIO()
+    n_rows, spikes = 0, []
+    for bank_id in bank_ids:
+        shard = generate_shard(bank_id, loan_date, seed)
+        write_shard_csv(shard, buf)
+        n_rows += len(shard["orig_amt"])
+        if shard["multiplier"] > 1:
+            spikes.append((bank_id, len(shard["orig_amt"]), shard["multiplier"]))
+    buf.seek(0)
+    with _worker_conn.cursor() as cur:
+        # replace, don't append: shards are deterministic per (loan_date, bank), so a re-run
+        # rewrites exactly the same loans (delete hits one partition)
+        cur.execute("DELETE FROM loan_portfolio WHERE loan_date = %s AND bank_id = ANY(%s);",
+                    (loan_date, list(bank_ids)))
+        cur.copy_expert(COPY_SQL, buf)
+        refresh_rollup_days(cur, [loan_date]) # same transaction as the loans
+    _worker_conn.commit()
+    return loan_date, n_rows, spikes
+
+def simulate_loans_for_all_days(num_days = NUM_DAYS, start_date = START_DATE, workers = NUM_WORKERS, seed = RANDOM_SEED):
     banks = fetch_banks()
+    names = dict(banks)
+    # loans must land in monthly partitions, not the default one
+    ensure_partitions(start_date.date(), (start_date + timedelta(days = num_days - 1)).date())
+    task = partial(load_day, bank_ids = [b[0] for b in banks], start_date = start_date, seed = seed)
     total_rows = 0
-    for day in range(NUM_DAYS):
-        loan_date = START_DATE + timedelta(days = day)
-        daily_rows = []
-
-        for bank_id, bank_name in banks:
-            #Determine if today is a spike day for this bank
-            if random.random() < SPIKE_PROB_PER_DAY:
-                multiplier = random.randint(*SPIKE_MULTIPLIER_RANGE)
-                loan_count = LOANS_PER_BANK_PER_DAY*multiplier
-                print(f"Spike! {bank_name} has {loan_count} loans on {loan_date.date()} (x{multiplier})")
-            else:
-                loan_count = LOANS_PER_BANK_PER_DAY
-
-            daily_rows.extend(generate_loans_for_day(bank_id, loan_date, n_loans = loan_count))
-
-        bulk_insert_loans(daily_rows)
-        total_rows += len(daily_rows)
-        print(f"(\{loan_date.date()} → {len(daily_rows)} loans inserted.")
-
-    print(f"\n Done. Inserted {total_rows} loans over {NUM_DAYS} days.")
+
+    def report(results):
+        nonlocal total_rows
+        for loan_date, n_rows, spikes in results:
+            for bank_id, loan_count, multiplier in spikes:
+                print(f"Spike! {names[bank_id]} has {loan_count} loans on {loan_date} (x{multiplier})")
+            total_rows += n_rows
+            print(f"{loan_date} → {n_rows} loans inserted.")
+
+    if workers <= 1:
+        _init_worker()
+        try:
+            report(map(task, range(num_days)))
+        finally:
+            _worker_conn.close()
+    else:
+        with ProcessPoolExecutor(max_workers = workers, initializer = _init_worker) as pool:
+            report(pool.map(task, range(num_days)))
+
+    print(f"\n Done. Inserted {total_rows} loans over {num_days} days.")
+    return total_rows
 
 if __name__ == "__main__":
     simulate_loans_for_all_days()
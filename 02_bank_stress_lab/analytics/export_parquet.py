@@ -0,0 +1,55 @@
+# bank_metrics -> partitioned Parquet for BI (Tableau / Power BI / Excel)
+# Writes tableau_exports/parquet/bank_metrics/as_of=YYYY-MM-DD/part-0.parquet plus
+# _manifest.json via risklab_common.parquet_export (shared with 01_Bonds_risk). Dates
+# from the latest exported one on are fingerprinted and rewritten if new or changed
+# (row count / checksum vs the manifest); use --since after correcting older dates.
+# risklab_common lives at the repo root, which must be on PYTHONPATH:
+#   PYTHONPATH=.. python -m analytics.export_parquet
+
+import argparse
+from datetime import date
+from pathlib import Path
+
+import pyarrow as pa
+
+from risklab_common.parquet_export import export_table
+
+from analytics.db import get_conn
+
+TABLE = "bank_metrics"
+EXPORT_ROOT = Path(__file__).resolve().parents[1] / "tableau_exports" / "parquet"
+
+SCHEMA = pa.schema([
+    pa.field("as_of", pa.date32(), nullable=False),
+    pa.field("bank_id", pa.int32(), nullable=False),
+    pa.field("loans_amt", pa.float64()),
+    pa.field("deposits_amt", pa.float64()),
+    pa.field("npl_amt", pa.float64()),
+    pa.field("ldr", pa.float64()),
+    pa.field("npl_pct", pa.float64()),
+    pa.field("car", pa.float64()),
+])
+
+BASE_SQL = """
+    SELECT as_of, bank_id, loans_amt::float8 AS loans_amt, deposits_amt::float8 AS deposits_amt,
+           npl_amt::float8 AS npl_amt, ldr::float8 AS ldr, npl_pct::float8 AS npl_pct, car::float8 AS car
+    FROM bank_metrics
+"""
+
+
+def export_bank_metrics(root=EXPORT_ROOT, since=None):
+    """
+    Export every new or changed as_of in bank_metrics under root/bank_metrics.
+    since: also re-export dates >= since regardless of the manifest.
+    Returns the list of exported dates.
+    """
+    return export_table(get_conn, TABLE, BASE_SQL, SCHEMA, root, since)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export bank_metrics to partitioned Parquet.")
+    parser.add_argument("--out", default=str(EXPORT_ROOT), help="export root directory")
+    parser.add_argument("--since", type=date.fromisoformat, help="re-export as_of dates on or after YYYY-MM-DD")
+    args = parser.parse_args()
+    exported = export_bank_metrics(args.out, args.since)
+    print(f"✅ Exported {len(exported)} as_of partition(s) of {TABLE} to {Path(args.out) / TABLE}")
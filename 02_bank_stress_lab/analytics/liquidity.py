@@ -0,0 +1,185 @@
+# liquidity run-off stress
+# Per-bank daily deposit log-changes from bank_daily_deposits give the outflow
+# distribution (drift, volatility). Stress scenarios scale volatility, shift the
+# drift and apply a day-one run; thousands of deposit paths per bank are projected
+# as (banks x paths x days) arrays. Against liquid assets (deposits + capital - loans,
+# i.e. funding not lent out) that gives a survival horizon and an LCR-style ratio.
+
+import warnings
+from datetime import date, timedelta
+
+import numpy as np
+from psycopg2.extras import execute_values
+
+from analytics.db import get_conn
+
+AS_OF = date(2025, 7, 23)
+RANDOM_SEED = 42
+
+LOOKBACK_DAYS = 90          # deposit history used to fit outflows
+N_PATHS = 5_000
+HORIZON_DAYS = 90           # survival horizon is censored here
+LCR_DAYS = 30               # LCR-style window
+LCR_QUANTILE = 0.95         # stressed outflow = 95th percentile of 30-day outflow
+BANK_CHUNK = 20             # banks per pass -> 20 x 5k x 90 = 9M values per array
+MIN_VOLATILITY = 0.001      # for banks with too little history
+
+# name: (volatility multiplier, daily drift shift, day-one run-off)
+LIQUIDITY_SCENARIOS = {
+    "base":     (1.0,  0.0,    0.00),
+    "moderate": (1.5, -0.002,  0.02),
+    "severe":   (3.0, -0.005,  0.05),
+    "bank_run": (5.0, -0.010,  0.15),
+}
+
+
+def load_inputs(as_of=AS_OF, lookback_days=LOOKBACK_DAYS):
+    """bank_ids, deposit history matrix (banks x days, NaN where missing) and as_of balance sheet."""
+    start = as_of - timedelta(days=lookback_days)
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT b.bank_id, b.capital, dd.deposits, COALESCE(SUM(r.balance), 0)
+                FROM banks b
+                LEFT JOIN bank_daily_deposits dd ON dd.bank_id = b.bank_id AND dd.deposit_date = %(as_of)s
+                LEFT JOIN loan_daily_rollup r ON r.bank_id = b.bank_id AND r.loan_date <= %(as_of)s
+                GROUP BY b.bank_id, b.capital, dd.deposits
+                ORDER BY b.bank_id;
+            """, {"as_of": as_of})
+            sheet = cur.fetchall()
+            cur.execute("""
+                SELECT bank_id, deposit_date, deposits
+                FROM bank_daily_deposits
+                WHERE deposit_date BETWEEN %s AND %s;
+            """, (start, as_of))
+            hist = cur.fetchall()
+
+    bank_ids = np.array([r[0] for r in sheet])
+    b_idx = {b: i for i, b in enumerate(bank_ids.tolist())}
+    history = np.full((len(bank_ids), lookback_days + 1), np.nan)
+    for bank_id, d, dep in hist:
+        if bank_id in b_idx:
+            history[b_idx[bank_id], (d - start).days] = float(dep)
+    return dict(
+        bank_ids=bank_ids,
+        history=history,
+        capital=np.array([float(r[1] or 0) for r in sheet]),
+        deposits=np.array([float(r[2]) if r[2] is not None else np.nan for r in sheet]),
+        loans=np.array([float(r[3] or 0) for r in sheet]),
+    )
+
+
+def fit_outflows(history):
+    """Per-bank mean and std of daily deposit log-changes (gaps are skipped, not bridged)."""
+    with np.errstate(divide="ignore", invalid="ignore"), warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)  # banks with no / one observation
+        changes = np.diff(np.log(history), axis=1)
+        mu = np.nanmean(changes, axis=1)
+        sigma = np.nanstd(changes, axis=1, ddof=1)
+    return np.nan_to_num(mu), np.maximum(np.nan_to_num(sigma), MIN_VOLATILITY)
+
+
+def run_liquidity_stress(inputs, scenarios=LIQUIDITY_SCENARIOS, n_paths=N_PATHS, horizon=HORIZON_DAYS,
+                         lcr_days=LCR_DAYS, seed=RANDOM_SEED, bank_chunk=BANK_CHUNK):
+    """
+    Returns {scenario: dict of per-bank arrays}: liquid_assets, outflow_lcr (stressed 30-day outflow),
+    lcr, survival_p5 / survival_median (days), breach_prob (within horizon).
+    Every scenario sees the same random draws (common random numbers), so they compare cleanly.
+    Banks without deposits on as_of (no bank_daily_deposits row) get NaN everywhere rather
+    than a run that cannot happen.
+    """
+    mu, sigma = fit_outflows(inputs["history"])
+    deposits = np.nan_to_num(inputs["deposits"])
+    liquid = np.maximum(deposits + inputs["capital"] - inputs["loans"], 0.0)
+    n_banks = len(inputs["bank_ids"])
+
+    out = {name: {k: np.empty(n_banks) for k in
+                  ("outflow_lcr", "lcr", "survival_p5", "survival_median", "breach_prob")}
+           for name in scenarios}
+    for name in scenarios:
+        out[name]["liquid_assets"] = liquid
+
+    t = np.arange(1, horizon + 1, dtype=np.float32)
+    for chunk, start in enumerate(range(0, n_banks, bank_chunk)):
+        sl = slice(start, start + bank_chunk)
+        rng = np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(chunk,)))
+        # cumulative shocks, shared by every scenario: log path = drift * t + vol * walk
+        walk = np.cumsum(rng.standard_normal((len(deposits[sl]), n_paths, horizon), dtype=np.float32), axis=2)
+        d0 = deposits[sl]
+
+        for name, (vol_mult, drift_shift, day1_runoff) in scenarios.items():
+            drift = (mu[sl] + drift_shift).astype(np.float32)[:, None, None]
+            vol = (sigma[sl] * vol_mult).astype(np.float32)[:, None, None]
+            log_path = drift * t + vol * walk                          # log(D_t / (D_0 * (1 - run-off)))
+
+            # D_0 - D_t > liquid  <=>  log_path < log((D_0 - liquid) / (D_0 * (1 - run-off)))
+            with np.errstate(divide="ignore", invalid="ignore"):
+                thr = np.log(np.maximum(d0 - liquid[sl], 0.0) / (d0 * (1.0 - day1_runoff)))
+            thr = np.nan_to_num(thr, nan=-np.inf, neginf=-np.inf).astype(np.float32)  # no deposits -> nothing to run
+
+            breach = log_path < thr[:, None, None]
+            breached = breach.any(axis=2)
+            survival = np.where(breached, breach.argmax(axis=2), horizon)  # full days before breach
+
+            outflow = d0[:, None] * (1.0 - (1.0 - day1_runoff) * np.exp(log_path[:, :, lcr_days - 1]))
+            q_outflow = np.quantile(outflow, LCR_QUANTILE, axis=1)
+            res = out[name]
+            res["outflow_lcr"][sl] = q_outflow
+            with np.errstate(divide="ignore", invalid="ignore"):
+                res["lcr"][sl] = np.where(q_outflow > 0, liquid[sl] / q_outflow, np.nan)
+            res["survival_p5"][sl] = np.percentile(survival, 5, axis=1)
+            res["survival_median"][sl] = np.median(survival, axis=1)
+            res["breach_prob"][sl] = breached.mean(axis=1)
+
+    unknown = ~(inputs["deposits"] > 0)
+    for res in out.values():
+        for key in res:
+            res[key] = np.where(unknown, np.nan, res[key])
+    return out
+
+
+def _num(x, digits=6):
+    return None if np.isnan(x) else round(float(x), digits)
+
+
+def store_results(as_of, inputs, results, n_paths=N_PATHS, horizon=HORIZON_DAYS):
+    sql = """
+        INSERT INTO bank_liquidity_results
+        (as_of, bank_id, scenario, deposits_amt, liquid_assets_amt, outflow_30d_amt, lcr,
+         survival_days_p5, survival_days_median, breach_prob, n_paths, horizon_days)
+        VALUES %s
+        ON CONFLICT (as_of, bank_id, scenario)
+        DO UPDATE SET deposits_amt = EXCLUDED.deposits_amt,
+                        liquid_assets_amt = EXCLUDED.liquid_assets_amt,
+                        outflow_30d_amt = EXCLUDED.outflow_30d_amt,
+                        lcr = EXCLUDED.lcr,
+                        survival_days_p5 = EXCLUDED.survival_days_p5,
+                        survival_days_median = EXCLUDED.survival_days_median,
+                        breach_prob = EXCLUDED.breach_prob,
+                        n_paths = EXCLUDED.n_paths,
+                        horizon_days = EXCLUDED.horizon_days;
+    """
+    rows = [
+        (as_of, int(bank_id), name, _num(inputs["deposits"][i], 2), _num(res["liquid_assets"][i], 2),
+         _num(res["outflow_lcr"][i], 2), _num(res["lcr"][i]),
+         _num(res["survival_p5"][i], 1), _num(res["survival_median"][i], 1), _num(res["breach_prob"][i]),
+         n_paths, horizon)
+        for name, res in results.items()
+        for i, bank_id in enumerate(inputs["bank_ids"])
+    ]
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            execute_values(cur, sql, rows, page_size=5000)
+        conn.commit()
+
+
+def run_and_store(as_of=AS_OF):
+    inputs = load_inputs(as_of)
+    results = run_liquidity_stress(inputs)
+    store_results(as_of, inputs, results)
+    print(f"Liquidity stress: {len(inputs['bank_ids'])} banks x {len(results)} scenarios x {N_PATHS} paths for {as_of}.")
+    return results
+
+
+if __name__ == "__main__":
+    run_and_store()
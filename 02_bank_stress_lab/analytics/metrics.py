@@ -4,46 +4,95 @@ from datetime import date
 from analytics.db import get_conn
 
 AS_OF = date(2025, 7, 23) #change daily
-def compute_base_metrics(as_of = AS_OF):
-    sql = """
-        SELECT b.bank_id, b.total_deposits, b.capital,
-            SUM(l.current_bal) AS total_loans,
-            SUM(l.current_bal * l.risk_weight) AS risk_weighted_loans,
-            SUM(l.current_bal) FILTER (WHERE l.default_flag) AS npl_amt
-        FROM banks b
-        LEFT JOIN loan_portfolio l ON b.bank_id = l.bank_id
-        GROUP BY b.bank_id, b.total_deposits, b.capital
-        ORDER by b.bank_id;
-    """
-
-    insert_sql = """
-        INSERT INTO bank_metrics (as_of, bank_id, loans_amt, deposits_amt, npl_amt, ldr, npl_pct, car)
-        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-        ON CONFLICT (as_of, bank_id)
-        DO UPDATE SET loans_amt = EXCLUDED.loans_amt,
-                        deposits_amt = EXCLUDED.deposits_amt,
-                        npl_amt = EXCLUDED.npl_amt,
-                        ldr = EXCLUDED.ldr,
-                        npl_pct = EXCLUDED.npl_pct,
-                        car = EXCLUDED.car;
-    """
+
+# Point-in-time metrics for every (as_of, bank_id) in [start, end], in one statement:
+# loans are cumulative up to each as_of (opening book before start + running daily sums),
+# deposits are that day's bank_daily_deposits. Rows are upserted straight from the SELECT.
+# Loan sums come from loan_daily_rollup (bank x day x segment), not raw loans.
+RANGE_SQL = """
+    WITH days AS (
+        SELECT d::date AS as_of
+        FROM generate_series(%(start)s::date, %(end)s::date, interval '1 day') d
+    ),
+    opening AS (
+        -- book before the window
+        SELECT bank_id,
+            SUM(balance) AS loans,
+            SUM(rw_balance) AS rw_loans,
+            SUM(npl_balance) AS npl_amt
+        FROM loan_daily_rollup
+        WHERE loan_date < %(start)s
+        GROUP BY bank_id
+    ),
+    daily AS (
+        SELECT bank_id, loan_date,
+            SUM(balance) AS loans,
+            SUM(rw_balance) AS rw_loans,
+            SUM(npl_balance) AS npl_amt
+        FROM loan_daily_rollup
+        WHERE loan_date BETWEEN %(start)s AND %(end)s
+        GROUP BY bank_id, loan_date
+    ),
+    cum AS (
+        SELECT d.as_of, b.bank_id, b.capital,
+            COALESCE(o.loans, 0) + SUM(COALESCE(dl.loans, 0)) OVER w AS total_loans,
+            COALESCE(o.rw_loans, 0) + SUM(COALESCE(dl.rw_loans, 0)) OVER w AS risk_weighted_loans,
+            COALESCE(o.npl_amt, 0) + SUM(COALESCE(dl.npl_amt, 0)) OVER w AS npl_amt
+        FROM days d
+        CROSS JOIN banks b
+        LEFT JOIN opening o ON o.bank_id = b.bank_id
+        LEFT JOIN daily dl ON dl.bank_id = b.bank_id AND dl.loan_date = d.as_of
+        WINDOW w AS (PARTITION BY b.bank_id ORDER BY d.as_of)
+    )
+    INSERT INTO bank_metrics (as_of, bank_id, loans_amt, deposits_amt, npl_amt, ldr, npl_pct, car)
+    SELECT c.as_of, c.bank_id, c.total_loans, dd.deposits, c.npl_amt,
+        CASE WHEN c.total_loans > 0 THEN c.total_loans / NULLIF(dd.deposits, 0) END,
+        CASE WHEN c.total_loans > 0 THEN c.npl_amt / c.total_loans END,
+        CASE WHEN c.total_loans > 0 THEN c.capital / NULLIF(c.risk_weighted_loans, 0) END
+    FROM cum c
+    LEFT JOIN bank_daily_deposits dd ON dd.bank_id = c.bank_id AND dd.deposit_date = c.as_of
+    ON CONFLICT (as_of, bank_id)
+    DO UPDATE SET loans_amt = EXCLUDED.loans_amt,
+                    deposits_amt = EXCLUDED.deposits_amt,
+                    npl_amt = EXCLUDED.npl_amt,
+                    ldr = EXCLUDED.ldr,
+                    npl_pct = EXCLUDED.npl_pct,
+                    car = EXCLUDED.car;
+"""
+
+
+def compute_metrics_range(start, end):
+    """Compute and upsert LDR / NPL% / CAR for every bank and every day in [start, end]."""
+    if start > end:
+        raise ValueError(f"start {start} is after end {end}")
     with get_conn() as conn:
         with conn.cursor() as cur:
-            cur.execute(sql)
-            rows = cur.fetchall()
-
-            for bank_id, deposits, capital, total_loans, risk_weighted_loans, npl_amt in rows:
-                if not total_loans or total_loans == 0:
-                    ldr = None
-                    npl_pct = None
-                    car = None
-                else:
-                    ldr = total_loans / deposits if deposits else None
-                    npl_pct = npl_amt / total_loans if npl_amt else 0
-                    car = capital / risk_weighted_loans if risk_weighted_loans else None
-        
-                cur.execute(insert_sql, (as_of ,bank_id, total_loans, deposits, npl_amt, ldr, npl_pct, car))
+            cur.execute(RANGE_SQL, {"start": start, "end": end})
+            n_rows = cur.rowcount
         conn.commit()
+    return n_rows
+
+
+def compute_base_metrics(as_of = AS_OF):
+    return compute_metrics_range(as_of, as_of)
+
+
+def loan_date_bounds():
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT MIN(loan_date), MAX(loan_date) FROM loan_daily_rollup;")
+            return cur.fetchone()
+
+
+def compute_metrics_history():
+    # full daily history over the simulated loan dates
+    start, end = loan_date_bounds()
+    if start is None:
+        print("No dated loans — nothing to compute.")
+        return 0
+    n_rows = compute_metrics_range(start, end)
+    print(f"Upserted {n_rows} bank_metrics rows for {start} → {end}.")
+    return n_rows
 
 if __name__ == "__main__":
-    compute_base_metrics()
+    compute_metrics_history()
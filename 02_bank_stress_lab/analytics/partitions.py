@@ -0,0 +1,120 @@
+# loan_portfolio partition maintenance (see db/04_partition_loan_portfolio.sql)
+# Monthly range partitions on loan_date, named loan_portfolio_pYYYY_MM.
+
+from datetime import date
+
+from analytics.db import get_conn
+
+PARENT = "loan_portfolio"
+PREFIX = "loan_portfolio_p"
+ARCHIVE_SCHEMA = "archive"
+
+
+def month_start(d):
+    return date(d.year, d.month, 1)
+
+
+def next_month(d):
+    return date(d.year + d.month // 12, d.month % 12 + 1, 1)
+
+
+def partition_name(month):
+    return f"{PREFIX}{month:%Y_%m}"
+
+
+def is_partitioned(cur):
+    cur.execute("""
+        SELECT EXISTS (
+            SELECT 1 FROM pg_partitioned_table pt
+            JOIN pg_class c ON c.oid = pt.partrelid
+            WHERE c.relname = %s AND pg_table_is_visible(c.oid)
+        );
+    """, (PARENT,))
+    return cur.fetchone()[0]
+
+
+def list_partitions(cur):
+    """Monthly partitions currently attached: [(month, name), ...] oldest first."""
+    cur.execute("""
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        JOIN pg_class p ON p.oid = i.inhparent
+        WHERE p.relname = %s AND c.relname LIKE %s
+        ORDER BY c.relname;
+    """, (PARENT, PREFIX + "%"))
+    out = []
+    for (name,) in cur.fetchall():
+        y, m = name[len(PREFIX):].split("_")
+        out.append((date(int(y), int(m), 1), name))
+    return out
+
+
+def ensure_partitions(start, end):
+    """Create any missing monthly partitions covering [start, end]. No-op on an unpartitioned table."""
+    created = []
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            if not is_partitioned(cur):
+                return created
+            existing = {m for m, _ in list_partitions(cur)}
+            m = month_start(start)
+            while m <= end:
+                if m not in existing:
+                    # fails if the default partition already holds rows for this month
+                    cur.execute(
+                        f"CREATE TABLE IF NOT EXISTS {partition_name(m)} PARTITION OF {PARENT} "
+                        "FOR VALUES FROM (%s) TO (%s);",
+                        (m, next_month(m)),
+                    )
+                    created.append(partition_name(m))
+                m = next_month(m)
+        conn.commit()
+    return created
+
+
+def detach_partitions(before, archive=True):
+    """
+    Detach monthly partitions that end on or before `before`.
+    archive=True moves them to the archive schema; otherwise they stay as plain tables.
+    Detached loans no longer appear in loan_portfolio queries; loan_daily_rollup keeps
+    their totals, so metrics and scenarios are unaffected.
+    """
+    detached = []
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            if archive:
+                cur.execute(f"CREATE SCHEMA IF NOT EXISTS {ARCHIVE_SCHEMA};")
+            for m, name in list_partitions(cur):
+                if next_month(m) > before:
+                    break
+                cur.execute(f"ALTER TABLE {PARENT} DETACH PARTITION {name};")
+                if archive:
+                    cur.execute(f"ALTER TABLE {name} SET SCHEMA {ARCHIVE_SCHEMA};")
+                detached.append(name)
+        conn.commit()
+    return detached
+
+
+def attach_archived_partition(month):
+    # bring an archived month back into loan_portfolio
+    name = partition_name(month_start(month))
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute(f"ALTER TABLE {ARCHIVE_SCHEMA}.{name} SET SCHEMA public;")
+            cur.execute(
+                f"ALTER TABLE {PARENT} ATTACH PARTITION {name} FOR VALUES FROM (%s) TO (%s);",
+                (month_start(month), next_month(month_start(month))),
+            )
+        conn.commit()
+    return name
+
+
+if __name__ == "__main__":
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            if not is_partitioned(cur):
+                print("loan_portfolio is not partitioned — run db/04_partition_loan_portfolio.sql first.")
+            else:
+                for m, name in list_partitions(cur):
+                    print(m, name)
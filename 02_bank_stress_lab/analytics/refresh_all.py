@@ -1 +1,230 @@
 #rebuild pipeline
+# Each stage declares the tables it reads and writes; the DAG is derived from that.
+# Independent stages run in parallel, so a full refresh takes as long as its
+# critical path. A stage is skipped when no upstream stage ran in this refresh and
+# its input tables are unchanged (pg_stat counters) since its last successful run.
+
+import argparse
+import importlib
+import json
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Callable
+
+from analytics.db import get_conn
+
+MAX_WORKERS = 4
+
+
+def _lazy(module, func):
+    # stage modules are imported when the stage runs, so the runner itself does not need
+    # every stage's dependencies (pyarrow for the export, scipy for credit loss, ...)
+    def run():
+        return getattr(importlib.import_module(f"analytics.{module}"), func)()
+    run.__name__ = f"{module}.{func}"
+    return run
+
+
+@dataclass(frozen=True)
+class Stage:
+    name: str
+    func: Callable
+    inputs: tuple = ()
+    outputs: tuple = ()
+    generator: bool = False     # produces synthetic source data; only runs with generate=True
+
+
+STAGES = [
+    # replaces the synthetic loan days wholesale, so it is opt-in (--generate) rather than
+    # something a routine refresh does to an existing loan book
+    Stage("loans", _lazy("data_generator", "simulate_loans_for_all_days"),
+          inputs=("banks",), outputs=("loan_portfolio", "loan_daily_rollup"), generator=True),
+    Stage("deposits", _lazy("simulate_daily_deposits", "simulate_daily_deposits"),
+          inputs=("banks", "loan_portfolio"), outputs=("bank_daily_deposits",)),
+    Stage("metrics", _lazy("metrics", "compute_metrics_history"),
+          inputs=("banks", "loan_daily_rollup", "bank_daily_deposits"), outputs=("bank_metrics",)),
+    Stage("scenarios", _lazy("scenarios", "run_and_store"),
+          inputs=("banks", "loan_daily_rollup", "bank_daily_deposits"),
+          outputs=("stress_scenarios", "bank_stress_results")),
+    Stage("credit_loss", _lazy("credit_loss", "run_credit_loss"),
+          inputs=("loan_portfolio",), outputs=("bank_credit_loss",)),
+    Stage("liquidity", _lazy("liquidity", "run_and_store"),
+          inputs=("banks", "loan_daily_rollup", "bank_daily_deposits"), outputs=("bank_liquidity_results",)),
+    # writes files only (new as_of partitions), so it declares no output tables
+    Stage("export", _lazy("export_parquet", "export_bank_metrics"), inputs=("bank_metrics",)),
+]
+
+
+def build_dag(stages):
+    """Map stage name -> set of upstream stage names (producers of its inputs)."""
+    producers = {}
+    for s in stages:
+        for t in s.outputs:
+            if t in producers:
+                raise ValueError(f"Table {t} written by both {producers[t]} and {s.name}")
+            producers[t] = s.name
+    deps = {s.name: {producers[t] for t in s.inputs if t in producers and producers[t] != s.name}
+            for s in stages}
+
+    # cycle check (Kahn)
+    remaining = {k: set(v) for k, v in deps.items()}
+    while remaining:
+        ready = [k for k, v in remaining.items() if not v]
+        if not ready:
+            raise ValueError(f"Cycle between stages: {sorted(remaining)}")
+        for k in ready:
+            del remaining[k]
+        for v in remaining.values():
+            v.difference_update(ready)
+    return deps
+
+
+def table_stats(tables):
+    # Sums over partitions too, so partitioned tables are fingerprinted by their children.
+    sql = """
+        SELECT p.relname,
+               SUM(s.n_tup_ins + s.n_tup_upd + s.n_tup_del) AS changes,
+               SUM(s.n_live_tup) AS live_rows
+        FROM pg_class p
+        LEFT JOIN pg_inherits i ON i.inhparent = p.oid
+        JOIN pg_stat_user_tables s ON s.relid = COALESCE(i.inhrelid, p.oid)
+        WHERE p.relname = ANY(%s)
+        GROUP BY p.relname;
+    """
+    if not tables:
+        return {}
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute(sql, (list(tables),))
+            rows = cur.fetchall()
+    stats = {t: {"changes": None, "live_rows": None} for t in tables}
+    for relname, changes, live_rows in rows:
+        stats[relname] = {"changes": int(changes), "live_rows": int(live_rows)}
+    return stats
+
+
+def last_successful_fingerprints():
+    sql = """
+        SELECT DISTINCT ON (stage) stage, input_fingerprint
+        FROM pipeline_runs
+        WHERE status = 'ok'
+        ORDER BY stage, finished_at DESC;
+    """
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute(sql)
+            return dict(cur.fetchall())
+
+
+def record_run(refresh_id, stage, status, started_at, finished_at, duration_s,
+               fingerprint=None, output_rows=None, error=None):
+    sql = """
+        INSERT INTO pipeline_runs
+        (refresh_id, stage, status, started_at, finished_at, duration_s, input_fingerprint, output_rows, error)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s);
+    """
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute(sql, (refresh_id, stage, status, started_at, finished_at, round(duration_s, 3),
+                              json.dumps(fingerprint) if fingerprint is not None else None,
+                              json.dumps(output_rows) if output_rows is not None else None,
+                              error))
+        conn.commit()
+
+
+def run_stage(refresh_id, stage, upstream_ran, last_fingerprint, force=False):
+    started_at = datetime.now(timezone.utc)
+    fingerprint = {t: s["changes"] for t, s in table_stats(stage.inputs).items()}
+
+    if not force and not upstream_ran and last_fingerprint == fingerprint:
+        record_run(refresh_id, stage.name, "skipped", started_at, started_at, 0.0, fingerprint)
+        return {"stage": stage.name, "status": "skipped", "duration_s": 0.0, "output_rows": None}
+
+    t0 = time.perf_counter()
+    status, error = "ok", None
+    try:
+        stage.func()
+    except Exception as e:
+        status, error = "failed", f"{type(e).__name__}: {e}"
+    duration_s = time.perf_counter() - t0
+
+    output_rows = {t: s["live_rows"] for t, s in table_stats(stage.outputs).items()}
+    record_run(refresh_id, stage.name, status, started_at, datetime.now(timezone.utc), duration_s,
+               fingerprint, output_rows, error)
+    return {"stage": stage.name, "status": status, "duration_s": duration_s,
+            "output_rows": output_rows, "error": error}
+
+
+def run_pipeline(stages=STAGES, force=False, only=None, max_workers=MAX_WORKERS, generate=False):
+    """
+    Run stages in dependency order, in parallel where the DAG allows.
+    only: optional set of stage names to run (their upstreams are treated as up to date).
+    generate: include data-generator stages; otherwise their tables are treated as sources.
+    Returns {stage: result dict}.
+    """
+    skipped = {s.name for s in stages if s.generator and not generate}
+    if only and skipped & set(only):
+        raise ValueError(f"Stage(s) {sorted(skipped & set(only))} generate data; pass generate=True (--generate)")
+    stages = [s for s in stages if s.name not in skipped]
+    deps = build_dag(stages)
+    by_name = {s.name: s for s in stages}
+    if only:
+        unknown = set(only) - set(by_name)
+        if unknown:
+            raise ValueError(f"Unknown stage(s): {sorted(unknown)}")
+        deps = {k: v & set(only) for k, v in deps.items() if k in only}
+
+    refresh_id = uuid.uuid4().hex[:12]
+    last_ok = last_successful_fingerprints()
+    pending = set(deps)
+    results = {}
+    running = {}
+    t0 = time.perf_counter()
+    print(f"⏳ Refresh {refresh_id}: {len(pending)} stages")
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        while pending or running:
+            for name in sorted(pending):
+                if not deps[name] <= results.keys():
+                    continue
+                pending.discard(name)
+                upstream = [results[d]["status"] for d in deps[name]]
+                if any(st in ("failed", "blocked") for st in upstream):
+                    now = datetime.now(timezone.utc)
+                    record_run(refresh_id, name, "blocked", now, now, 0.0)
+                    results[name] = {"stage": name, "status": "blocked", "duration_s": 0.0, "output_rows": None}
+                    print(f"⛔ {name}: blocked by failed upstream")
+                    continue
+                fut = pool.submit(run_stage, refresh_id, by_name[name], "ok" in upstream,
+                                  last_ok.get(name), force)
+                running[fut] = name
+
+            if not running:
+                continue
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for fut in finished:
+                name = running.pop(fut)
+                res = fut.result()
+                results[name] = res
+                if res["status"] == "failed":
+                    print(f"❌ {name}: {res['error']}")
+                else:
+                    print(f"✅ {name}: {res['status']} in {res['duration_s']:.2f}s  rows={res['output_rows']}")
+
+    wall = time.perf_counter() - t0
+    serial = sum(r["duration_s"] for r in results.values())
+    print(f"Done in {wall:.2f}s (sum of stages {serial:.2f}s).")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild bank stress lab tables.")
+    parser.add_argument("--force", action="store_true", help="run every stage even if inputs are unchanged")
+    parser.add_argument("--only", nargs="+", help="run only these stages")
+    parser.add_argument("--workers", type=int, default=MAX_WORKERS)
+    parser.add_argument("--generate", action="store_true", help="also (re)generate synthetic loans")
+    args = parser.parse_args()
+    run_pipeline(force=args.force, only=args.only, max_workers=args.workers, generate=args.generate)
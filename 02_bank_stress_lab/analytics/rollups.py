@@ -0,0 +1,51 @@
+# daily bank x segment loan rollups (see db/05_create_loan_daily_rollup.sql)
+# A touched day is re-aggregated from its own loans only (one partition, pruned by
+# loan_date) and swapped in, so the rollup stays exact under re-runs and appends.
+
+from analytics.db import get_conn
+
+AGG_COLUMNS = """
+    COUNT(*),
+    SUM(current_bal),
+    SUM(current_bal * risk_weight),
+    COALESCE(SUM(current_bal) FILTER (WHERE default_flag), 0),
+    COALESCE(SUM(current_bal * risk_weight) FILTER (WHERE default_flag), 0)
+"""
+
+INSERT_COLUMNS = "(bank_id, loan_date, seg_code, loan_count, balance, rw_balance, npl_balance, npl_rw_balance)"
+
+
+def refresh_rollup_days(cur, dates):
+    """Recompute the rollup rows for the given loan dates inside the caller's transaction."""
+    dates = list(dates)
+    if not dates:
+        return 0
+    cur.execute("DELETE FROM loan_daily_rollup WHERE loan_date = ANY(%s::date[]);", (dates,))
+    cur.execute(f"""
+        INSERT INTO loan_daily_rollup {INSERT_COLUMNS}
+        SELECT bank_id, loan_date, COALESCE(seg_code, 'UNKNOWN'), {AGG_COLUMNS}
+        FROM loan_portfolio
+        WHERE loan_date = ANY(%s::date[])
+        GROUP BY 1, 2, 3;
+    """, (dates,))
+    return cur.rowcount
+
+
+def rebuild_rollup():
+    # full rebuild, e.g. after manual edits to loan_portfolio
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute("TRUNCATE loan_daily_rollup;")
+            cur.execute(f"""
+                INSERT INTO loan_daily_rollup {INSERT_COLUMNS}
+                SELECT bank_id, loan_date, COALESCE(seg_code, 'UNKNOWN'), {AGG_COLUMNS}
+                FROM loan_portfolio
+                GROUP BY 1, 2, 3;
+            """)
+            n_rows = cur.rowcount
+        conn.commit()
+    return n_rows
+
+
+if __name__ == "__main__":
+    print(f"Rebuilt loan_daily_rollup: {rebuild_rollup()} rows.")
@@ -1 +1,249 @@
 # stress logic
+# Loads the bank book once as (bank x segment) arrays and applies a whole grid of
+# scenarios in one numpy pass. Stressed LDR / NPL% / CAR use the same definitions
+# as metrics.compute_base_metrics, so the unstressed scenario reproduces bank_metrics.
+
+import hashlib
+import itertools
+import json
+from datetime import date
+
+import numpy as np
+from psycopg2.extras import execute_values
+
+from analytics.db import get_conn
+from analytics.data_generator import SEG_CODES
+
+AS_OF = date(2025, 7, 23)
+
+DEFAULT_RISK_WEIGHT = 1.0   # newly defaulted loans migrate to this risk weight (same as data_generator)
+SCENARIO_CHUNK = 2000       # scenarios per pass, keeps memory at chunk x banks x segments
+
+# Default grid: 5 x 3 x 3 x 5 = 225 scenarios
+PD_MULTS = (1.0, 1.5, 2.0, 3.0, 5.0)
+LGDS = (0.25, 0.45, 0.65)
+RW_MULTS = (1.0, 1.2, 1.5)
+RUNOFFS = (0.0, 0.05, 0.10, 0.20, 0.30)
+
+
+def load_bank_book(as_of=AS_OF):
+    # point-in-time book, same as metrics: loans up to as_of, that day's deposits
+    # (loan sums from loan_daily_rollup)
+    sql = """
+        SELECT b.bank_id, dd.deposits, b.capital, r.seg_code,
+            SUM(r.balance) AS loans,
+            SUM(r.rw_balance) AS rw_loans,
+            SUM(r.npl_balance) AS npl_amt,
+            SUM(r.npl_rw_balance) AS npl_rw
+        FROM banks b
+        LEFT JOIN bank_daily_deposits dd ON dd.bank_id = b.bank_id AND dd.deposit_date = %(as_of)s
+        LEFT JOIN loan_daily_rollup r ON b.bank_id = r.bank_id AND r.loan_date <= %(as_of)s
+        GROUP BY b.bank_id, dd.deposits, b.capital, r.seg_code
+        ORDER BY b.bank_id;
+    """
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute(sql, {"as_of": as_of})
+            rows = cur.fetchall()
+    return _book_from_rows(rows)
+
+
+def _book_from_rows(rows):
+    # rows: (bank_id, deposits, capital, seg_code, loans, rw_loans, npl_amt, npl_rw)
+    bank_ids = sorted({r[0] for r in rows})
+    segs = list(SEG_CODES) + sorted({r[3] for r in rows if r[3] and r[3] not in SEG_CODES})
+    b_idx = {b: i for i, b in enumerate(bank_ids)}
+    s_idx = {s: j for j, s in enumerate(segs)}
+
+    n, k = len(bank_ids), len(segs)
+    book = dict(
+        bank_ids=np.array(bank_ids),
+        segs=segs,
+        deposits=np.zeros(n),
+        capital=np.zeros(n),
+        balance=np.zeros((n, k)),
+        rw=np.zeros((n, k)),
+        npl=np.zeros((n, k)),
+        npl_rw=np.zeros((n, k)),
+    )
+    for bank_id, deposits, capital, seg, loans, rw_loans, npl_amt, npl_rw in rows:
+        i = b_idx[bank_id]
+        book["deposits"][i] = float(deposits or 0)
+        book["capital"][i] = float(capital or 0)
+        if seg is None:
+            continue  # bank without loans
+        j = s_idx[seg]
+        book["balance"][i, j] = float(loans or 0)
+        book["rw"][i, j] = float(rw_loans or 0)
+        book["npl"][i, j] = float(npl_amt or 0)
+        book["npl_rw"][i, j] = float(npl_rw or 0)
+    return book
+
+
+def _by_segment(value, segs, neutral):
+    # scalar -> same for every segment, dict -> per seg_code (missing segments unstressed)
+    if isinstance(value, dict):
+        return [float(value.get(s, neutral)) for s in segs]
+    return [float(value)] * len(segs)
+
+
+def scenario_grid(pd_mults=PD_MULTS, lgds=LGDS, rw_mults=RW_MULTS, runoffs=RUNOFFS, segs=SEG_CODES):
+    """
+    Cartesian product of the given shocks. Each pd/lgd/rw entry is a scalar or a
+    {seg_code: value} dict. Returns dict of arrays: pd_mult, lgd, rw_mult (S x segments), runoff (S,).
+    """
+    combos = list(itertools.product(pd_mults, lgds, rw_mults, runoffs))
+    return dict(
+        segs=list(segs),
+        pd_mult=np.array([_by_segment(c[0], segs, 1.0) for c in combos]),
+        lgd=np.array([_by_segment(c[1], segs, 0.0) for c in combos]),
+        rw_mult=np.array([_by_segment(c[2], segs, 1.0) for c in combos]),
+        runoff=np.array([float(c[3]) for c in combos]),
+    )
+
+
+def _align_grid(grid, segs):
+    # book may carry extra seg_codes found in the data; they get no shock
+    if list(grid["segs"]) == list(segs):
+        return grid
+    pos = {s: j for j, s in enumerate(grid["segs"])}
+    s = len(grid["runoff"])
+    out = dict(segs=list(segs), runoff=grid["runoff"])
+    for key, neutral in (("pd_mult", 1.0), ("lgd", 0.0), ("rw_mult", 1.0)):
+        arr = np.full((s, len(segs)), neutral)
+        for j, seg in enumerate(segs):
+            if seg in pos:
+                arr[:, j] = grid[key][:, pos[seg]]
+        out[key] = arr
+    return out
+
+
+def run_stress(book, grid, chunk=SCENARIO_CHUNK):
+    """
+    Apply every scenario in grid to every bank in book.
+    Returns dict of (S x banks) arrays: loans, deposits, npl, capital, rwa, ldr, npl_pct, car.
+    NaN where the ratio is undefined (no loans / no deposits / no RWA).
+    """
+    grid = _align_grid(grid, book["segs"])
+    bal, npl, npl_rw = book["balance"], book["npl"], book["npl_rw"]
+    perf = bal - npl
+    perf_rw = book["rw"] - npl_rw
+
+    base_rate = np.divide(npl, bal, out=np.zeros_like(bal), where=bal > 0)
+    perf_density = np.divide(perf_rw, perf, out=np.zeros_like(perf), where=perf > 0)
+    loans = bal.sum(axis=1)
+
+    s_total, n = len(grid["runoff"]), len(book["bank_ids"])
+    out = {key: np.empty((s_total, n)) for key in
+           ("loans", "deposits", "npl", "capital", "rwa", "ldr", "npl_pct", "car")}
+
+    for start in range(0, s_total, chunk):
+        sl = slice(start, start + chunk)
+        pd_mult = grid["pd_mult"][sl, None, :]      # (c, 1, k)
+        lgd = grid["lgd"][sl, None, :]
+        rw_mult = grid["rw_mult"][sl, None, :]
+        runoff = grid["runoff"][sl, None]           # (c, 1)
+
+        # newly defaulted balance per (scenario, bank, segment)
+        stressed_rate = np.minimum(base_rate * pd_mult, 1.0)
+        new_def = np.clip(bal * stressed_rate - npl, 0.0, perf)
+
+        # loans stay gross (as in bank_metrics); LGD losses come out of capital
+        npl_s = (npl + new_def).sum(axis=2)
+        loss = (new_def * lgd).sum(axis=2)
+        rwa = ((perf - new_def) * perf_density * rw_mult + npl_rw + new_def * DEFAULT_RISK_WEIGHT).sum(axis=2)
+        capital = book["capital"][None, :] - loss
+        deposits = book["deposits"][None, :] * (1.0 - runoff)
+        loans_s = np.broadcast_to(loans, npl_s.shape)
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            has_loans = loans_s > 0
+            out["ldr"][sl] = np.where(has_loans & (deposits != 0), loans_s / deposits, np.nan)
+            out["npl_pct"][sl] = np.where(has_loans, npl_s / loans_s, np.nan)
+            out["car"][sl] = np.where(has_loans & (rwa != 0), capital / rwa, np.nan)
+        out["loans"][sl] = loans_s
+        out["deposits"][sl] = deposits
+        out["npl"][sl] = npl_s
+        out["capital"][sl] = capital
+        out["rwa"][sl] = rwa
+    return out
+
+
+def _num(x):
+    return None if np.isnan(x) else float(x)
+
+
+def _params(grid, s):
+    segs = grid["segs"]
+    return dict(
+        pd_mult={seg: round(float(v), 10) for seg, v in zip(segs, grid["pd_mult"][s])},
+        lgd={seg: round(float(v), 10) for seg, v in zip(segs, grid["lgd"][s])},
+        rw_mult={seg: round(float(v), 10) for seg, v in zip(segs, grid["rw_mult"][s])},
+        runoff=round(float(grid["runoff"][s]), 10),
+    )
+
+
+def scenario_id(params):
+    # stable id from the shock parameters (63-bit, fits BIGINT): the same scenario gets the
+    # same id in every grid and on every as_of, so stored results never point at other shocks
+    digest = hashlib.sha256(json.dumps(params, sort_keys=True).encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") >> 1
+
+
+def store_results(as_of, book, grid, results):
+    # parameters of an id never change, so existing scenarios are left as they are
+    scen_sql = """
+        INSERT INTO stress_scenarios (scenario_id, pd_mult, lgd, rw_mult, runoff)
+        VALUES %s
+        ON CONFLICT (scenario_id) DO NOTHING;
+    """
+    insert_sql = """
+        INSERT INTO bank_stress_results
+        (as_of, scenario_id, bank_id, loans_amt, deposits_amt, npl_amt, capital_amt, rwa_amt, ldr, npl_pct, car)
+        VALUES %s
+        ON CONFLICT (as_of, scenario_id, bank_id)
+        DO UPDATE SET loans_amt = EXCLUDED.loans_amt,
+                        deposits_amt = EXCLUDED.deposits_amt,
+                        npl_amt = EXCLUDED.npl_amt,
+                        capital_amt = EXCLUDED.capital_amt,
+                        rwa_amt = EXCLUDED.rwa_amt,
+                        ldr = EXCLUDED.ldr,
+                        npl_pct = EXCLUDED.npl_pct,
+                        car = EXCLUDED.car;
+    """
+    params = [_params(grid, s) for s in range(len(grid["runoff"]))]
+    ids = [scenario_id(p) for p in params]
+    scen_rows = [
+        (sid, json.dumps(p["pd_mult"]), json.dumps(p["lgd"]), json.dumps(p["rw_mult"]), p["runoff"])
+        for sid, p in zip(ids, params)
+    ]
+    bank_ids = book["bank_ids"].tolist()
+    result_rows = (
+        (as_of, ids[s], bank_id,
+         round(float(results["loans"][s, i]), 2), round(float(results["deposits"][s, i]), 2),
+         round(float(results["npl"][s, i]), 2), round(float(results["capital"][s, i]), 2),
+         round(float(results["rwa"][s, i]), 2),
+         _num(results["ldr"][s, i]), _num(results["npl_pct"][s, i]), _num(results["car"][s, i]))
+        for s in range(len(grid["runoff"]))
+        for i, bank_id in enumerate(bank_ids)
+    )
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            execute_values(cur, scen_sql, scen_rows, page_size=5000)
+            # the stored grid for as_of is replaced as a whole, not merged with an older one
+            cur.execute("DELETE FROM bank_stress_results WHERE as_of = %s;", (as_of,))
+            execute_values(cur, insert_sql, result_rows, page_size=5000)
+        conn.commit()
+
+
+def run_and_store(as_of=AS_OF, grid=None):
+    book = load_bank_book(as_of)
+    grid = grid if grid is not None else scenario_grid()
+    results = run_stress(book, grid)
+    store_results(as_of, book, grid, results)
+    print(f"Stressed {len(book['bank_ids'])} banks x {len(grid['runoff'])} scenarios for {as_of}.")
+    return results
+
+
+if __name__ == "__main__":
+    run_and_store()
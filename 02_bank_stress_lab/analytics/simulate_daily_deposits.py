@@ -1,48 +1,109 @@
-import random
+from datetime import timedelta
+
+import numpy as np
 from analytics.db import get_conn
+from analytics.data_generator import START_DATE
+
+RANDOM_SEED = 42
+DEPOSIT_EPOCH = START_DATE.date()   # walk step k is the change on DEPOSIT_EPOCH + k days
+DAILY_DRIFT = 0.0           # mean daily log change
+DAILY_VOLATILITY = 0.0029   # std of daily log change (≈ the old ±0.5% uniform draw)
+DEPOSIT_FLOOR = 0.7         # deposits never fall below 70% of base
+
+
+def simulate_deposit_paths(base_deposits, n_days, drift=DAILY_DRIFT, volatility=DAILY_VOLATILITY,
+                           floor=DEPOSIT_FLOOR, seed=RANDOM_SEED, bank_ids=None):
+    """
+    Random-walk deposit paths for all banks at once, shape (banks, n_days); column k is
+    the value after k + 1 steps. Each bank draws from its own stream (seed, bank_id), so
+    longer paths extend shorter ones and adding banks leaves the others alone.
+
+    Same recursion as the old loop, d_t = max(d_{t-1} * exp(r_t), floor * base), solved
+    in closed form in log space: with y_t = log(d_t / (floor * base)) and S_t = cumsum(r),
+    y_t = S_t - min(-y_0, min_{s<=t} S_s).
+    """
+    base = np.asarray(base_deposits, dtype=float)
+    bank_ids = range(base.size) if bank_ids is None else bank_ids
+    steps = np.empty((base.size, n_days))
+    for i, bank_id in enumerate(bank_ids):
+        rng = np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(int(bank_id),)))
+        steps[i] = rng.normal(drift, volatility, size=n_days)
+
+    cum = np.cumsum(steps, axis=1)
+    y0 = -np.log(floor)
+    y = cum - np.minimum(-y0, np.minimum.accumulate(cum, axis=1))
+    return np.round(base[:, None] * floor * np.exp(y), 2)
+
 
-def simulate_daily_deposits():
+def deposits_for_dates(base_deposits, dates, drift=DAILY_DRIFT, volatility=DAILY_VOLATILITY,
+                       floor=DEPOSIT_FLOOR, seed=RANDOM_SEED, bank_ids=None, epoch=DEPOSIT_EPOCH):
+    """
+    Deposits (banks, len(dates)) on the given calendar dates. The walk is indexed by days
+    since epoch, not by position in dates, so a date's value does not depend on which
+    other dates are simulated (existing dates are never restated). Dates before epoch
+    hold the base deposits.
+    """
+    base = np.asarray(base_deposits, dtype=float)
+    offsets = np.array([(d - epoch).days for d in dates], dtype=int)
+    n_days = int(offsets.max()) + 1 if offsets.size and offsets.max() >= 0 else 0
+    paths = simulate_deposit_paths(base, n_days, drift, volatility, floor, seed, bank_ids)
+    out = np.repeat(np.round(base, 2)[:, None], offsets.size, axis=1)
+    walked = offsets >= 0
+    out[:, walked] = paths[:, offsets[walked]]
+    return out
+
+
+def upsert_deposits(cur, bank_ids, dates, paths):
+    # one statement: arrays are unnested server-side, no per-row round trips;
+    # unchanged days are not rewritten, so downstream fingerprints stay put
+    sql = """
+        INSERT INTO bank_daily_deposits (bank_id, deposit_date, deposits)
+        SELECT * FROM unnest(%s::int[], %s::date[], %s::numeric[])
+        ON CONFLICT (bank_id, deposit_date)
+        DO UPDATE SET deposits = EXCLUDED.deposits
+        WHERE bank_daily_deposits.deposits IS DISTINCT FROM EXCLUDED.deposits;
+    """
+    n_banks, n_days = paths.shape
+    cur.execute(sql, (
+        np.repeat(np.asarray(bank_ids), n_days).tolist(),
+        list(dates) * n_banks,
+        paths.ravel().tolist(),
+    ))
+    return cur.rowcount
+
+
+def simulate_daily_deposits(dates=None, drift=DAILY_DRIFT, volatility=DAILY_VOLATILITY,
+                            floor=DEPOSIT_FLOOR, seed=RANDOM_SEED):
     print("⏳ Starting deposit simulation...")
 
     with get_conn() as conn:
         with conn.cursor() as cur:
             # Step 1: Fetch banks
-            cur.execute("SELECT bank_id, total_deposits FROM banks;")
+            cur.execute("SELECT bank_id, total_deposits FROM banks ORDER BY bank_id;")
             banks = cur.fetchall()
             print(f"📌 Found {len(banks)} banks")
 
-            # Step 2: Fetch loan dates
-            cur.execute("SELECT DISTINCT loan_date FROM loan_portfolio WHERE loan_date IS NOT NULL ORDER BY loan_date;")
-            dates = [row[0] for row in cur.fetchall()]
-            print(f"📆 Found {len(dates)} unique loan dates")
+            # Step 2: Every day between the first and last loan date (unless given).
+            # MIN/MAX are answered from the loan_date index of the end partitions
+            # instead of a DISTINCT over the whole table.
+            if dates is None:
+                cur.execute("SELECT MIN(loan_date), MAX(loan_date) FROM loan_portfolio;")
+                first, last = cur.fetchone()
+                dates = [first + timedelta(days=i) for i in range((last - first).days + 1)] if first else []
+            print(f"📆 Simulating {len(dates)} dates")
 
             if not banks or not dates:
                 print("❌ No banks or loan dates found — aborting.")
-                return
-
-            insert_sql = """
-                INSERT INTO bank_daily_deposits (bank_id, deposit_date, deposits)
-                VALUES (%s, %s, %s)
-                ON CONFLICT (bank_id, deposit_date)
-                DO UPDATE SET deposits = EXCLUDED.deposits;
-            """
-
-            for bank_id, base_deposit in banks:
-                # Convert Decimal to float
-                base_deposit = float(base_deposit)
-                current_deposit = base_deposit
-
-                for dt in dates:
-                    drift = random.uniform(-0.005, 0.005)
-                    current_deposit *= (1 + drift)
-                    current_deposit = max(current_deposit, base_deposit * 0.7)
-                    value = round(current_deposit, 2)
+                return 0
 
-                    print(f"→ INSERT: bank_id={bank_id}, date={dt}, deposits={value}")
-                    cur.execute(insert_sql, (bank_id, dt, value))
+            bank_ids = [b[0] for b in banks]
+            base = [float(b[1]) for b in banks]
+            paths = deposits_for_dates(base, dates, drift, volatility, floor, seed, bank_ids)
+            n_rows = upsert_deposits(cur, bank_ids, dates, paths)
 
         conn.commit()
-        print("✅ Finished inserting all deposit rows.")
+        print(f"✅ Upserted {n_rows} deposit rows.")
+        return n_rows
 
 if __name__ == "__main__":
     simulate_daily_deposits()
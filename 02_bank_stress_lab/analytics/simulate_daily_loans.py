@@ -0,0 +1,265 @@
+# intraday loan events -> running bank metrics
+# Keeps per-bank running totals (loans, risk-weighted loans, NPL) seeded from
+# loan_daily_rollup and updates them in O(1) per event, so LDR / NPL% / CAR are
+# fresh after every event without rescanning loan_portfolio. Dirty banks are
+# periodically compacted into one bank_metrics row each for the as_of date.
+#
+# Events are dicts (or JSON lines):
+#   {"type": "originate", "loan_id", "bank_id", "current_bal", "risk_weight", "seg_code", "default_flag"}
+#   {"type": "balance",   "loan_id", "current_bal"}
+#   {"type": "default",   "loan_id"}
+# Loans originated in the stream are remembered (fully paid loans are forgotten, and at
+# most MAX_TRACKED_LOANS are kept, least recently touched dropped first); balance / default
+# events for other loans must also carry the loan's "bank_id", "old_bal", "risk_weight"
+# and "default_flag".
+#
+# Sources yield None while idle, so the time-based snapshot still fires when no events arrive.
+
+import json
+import queue
+import time
+from collections import OrderedDict
+from datetime import date
+
+import numpy as np
+from psycopg2.extras import execute_values
+
+from analytics.db import get_conn
+from analytics.data_generator import SEG_CODES
+
+DEFAULT_RISK_WEIGHT = 1.0   # risk weight once a loan defaults (same as data_generator)
+SNAPSHOT_EVERY = 10_000     # events between bank_metrics snapshots
+SNAPSHOT_SECONDS = 60       # ...or seconds, whichever comes first
+HEARTBEAT_SECONDS = 1.0     # idle sources yield None this often
+MAX_TRACKED_LOANS = 1_000_000
+RANDOM_SEED = 42
+
+
+class RunningBankMetrics:
+    def __init__(self, opening, max_loans=MAX_TRACKED_LOANS):
+        # opening: {bank_id: dict(loans, rw_loans, npl_amt, deposits, capital)}
+        self.totals = {b: dict(t) for b, t in opening.items()}
+        self.loans = OrderedDict()   # loan_id -> [bank_id, bal, risk_weight, default_flag], LRU order
+        self.max_loans = max_loans
+        self.dirty = set()
+        self.unmatched = 0
+
+    def _loan_state(self, event):
+        state = self.loans.pop(event["loan_id"], None)
+        if state is not None:
+            return state
+        if "old_bal" not in event:
+            return None
+        return [event["bank_id"], float(event["old_bal"]), float(event.get("risk_weight", 0.5)),
+                bool(event.get("default_flag", False))]
+
+    def _add(self, bank_id, bal, rw, defaulted, sign):
+        # banks missing from the opening book: balance sheet unknown, so LDR / CAR stay None
+        t = self.totals.setdefault(bank_id, dict(loans=0.0, rw_loans=0.0, npl_amt=0.0, deposits=None, capital=None))
+        t["loans"] += sign * bal
+        t["rw_loans"] += sign * bal * rw
+        if defaulted:
+            t["npl_amt"] += sign * bal
+
+    def _track(self, loan_id, state):
+        # paid-off loans are done; otherwise keep the most recently touched max_loans
+        self.loans.pop(loan_id, None)
+        if state[1] <= 0:
+            return
+        self.loans[loan_id] = state
+        if len(self.loans) > self.max_loans:
+            self.loans.popitem(last=False)
+
+    def apply(self, event):
+        """Apply one event; returns the affected bank_id (None if the event could not be matched)."""
+        kind = event["type"]
+        if kind == "originate":
+            state = [event["bank_id"], float(event["current_bal"]), float(event.get("risk_weight", 0.5)),
+                     bool(event.get("default_flag", False))]
+            self._track(event["loan_id"], state)
+            self._add(*state, +1)
+        elif kind in ("balance", "default"):
+            state = self._loan_state(event)
+            if state is None:
+                self.unmatched += 1
+                return None
+            self._add(*state, -1)
+            if kind == "balance":
+                state[1] = float(event["current_bal"])
+            elif not state[3]:
+                state[2], state[3] = float(event.get("new_risk_weight", DEFAULT_RISK_WEIGHT)), True
+            self._add(*state, +1)
+            self._track(event["loan_id"], state)
+        else:
+            raise ValueError(f"Unknown event type: {kind}")
+        self.dirty.add(state[0])
+        return state[0]
+
+    def metrics(self, bank_id):
+        # same definitions as metrics.compute_metrics_range
+        t = self.totals[bank_id]
+        loans, deposits = t["loans"], t["deposits"]
+        if loans <= 0:
+            return dict(loans_amt=loans, deposits_amt=deposits, npl_amt=t["npl_amt"], ldr=None, npl_pct=None, car=None)
+        return dict(
+            loans_amt=loans,
+            deposits_amt=deposits,
+            npl_amt=t["npl_amt"],
+            ldr=loans / deposits if deposits else None,
+            npl_pct=t["npl_amt"] / loans,
+            car=t["capital"] / t["rw_loans"] if t["rw_loans"] and t["capital"] is not None else None,
+        )
+
+
+def load_opening(as_of):
+    # rollup totals up to the day before as_of, plus the latest deposits on or before as_of
+    sql = """
+        SELECT b.bank_id, b.capital, d.deposits,
+            COALESCE(SUM(r.balance), 0), COALESCE(SUM(r.rw_balance), 0), COALESCE(SUM(r.npl_balance), 0)
+        FROM banks b
+        LEFT JOIN LATERAL (
+            SELECT deposits FROM bank_daily_deposits dd
+            WHERE dd.bank_id = b.bank_id AND dd.deposit_date <= %(as_of)s
+            ORDER BY dd.deposit_date DESC
+            LIMIT 1
+        ) d ON TRUE
+        LEFT JOIN loan_daily_rollup r ON r.bank_id = b.bank_id AND r.loan_date < %(as_of)s
+        GROUP BY b.bank_id, b.capital, d.deposits;
+    """
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute(sql, {"as_of": as_of})
+            rows = cur.fetchall()
+    return {
+        bank_id: dict(capital=float(capital) if capital is not None else None, deposits=float(deposits) if deposits is not None else None,
+                      loans=float(loans), rw_loans=float(rw_loans), npl_amt=float(npl_amt))
+        for bank_id, capital, deposits, loans, rw_loans, npl_amt in rows
+    }
+
+
+def snapshot(running, as_of):
+    """Upsert the latest state of every bank touched since the last snapshot (one row per bank)."""
+    if not running.dirty:
+        return 0
+    sql = """
+        INSERT INTO bank_metrics (as_of, bank_id, loans_amt, deposits_amt, npl_amt, ldr, npl_pct, car)
+        VALUES %s
+        ON CONFLICT (as_of, bank_id)
+        DO UPDATE SET loans_amt = EXCLUDED.loans_amt,
+                        deposits_amt = EXCLUDED.deposits_amt,
+                        npl_amt = EXCLUDED.npl_amt,
+                        ldr = EXCLUDED.ldr,
+                        npl_pct = EXCLUDED.npl_pct,
+                        car = EXCLUDED.car;
+    """
+    rows = []
+    for bank_id in sorted(running.dirty):
+        m = running.metrics(bank_id)
+        rows.append((as_of, bank_id, round(m["loans_amt"], 2), m["deposits_amt"], round(m["npl_amt"], 2),
+                     m["ldr"], m["npl_pct"], m["car"]))
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            execute_values(cur, sql, rows)
+        conn.commit()
+    running.dirty.clear()
+    return len(rows)
+
+
+def stream_metrics(events, as_of=None, opening=None, snapshot_every=SNAPSHOT_EVERY, snapshot_seconds=SNAPSHOT_SECONDS):
+    """
+    Consume events and yield (bank_id, metrics) after each one.
+    Snapshots go to bank_metrics every snapshot_every events / snapshot_seconds, and at the end.
+    None events are idle heartbeats: nothing is applied, but the timer is still checked.
+    """
+    as_of = as_of or date.today()
+    running = RunningBankMetrics(opening if opening is not None else load_opening(as_of))
+    since_snapshot, last_snapshot = 0, time.monotonic()
+    try:
+        for event in events:
+            if event is not None:
+                bank_id = running.apply(event)
+                if bank_id is not None:
+                    yield bank_id, running.metrics(bank_id)
+                since_snapshot += 1
+            if since_snapshot >= snapshot_every or time.monotonic() - last_snapshot >= snapshot_seconds:
+                snapshot(running, as_of)
+                since_snapshot, last_snapshot = 0, time.monotonic()
+    finally:
+        snapshot(running, as_of)
+        if running.unmatched:
+            print(f"⚠️ {running.unmatched} events referred to unknown loans and were skipped.")
+
+
+# ------------------------------------------------------------------
+# Event sources
+# ------------------------------------------------------------------
+def events_from_file(path, follow=False, poll_seconds=0.5):
+    # JSON lines; follow=True keeps tailing the file like `tail -f` (yielding None while idle).
+    # While following, a line is only parsed once its newline arrives: at EOF readline() can
+    # return what the writer has flushed of a line so far.
+    pending = ""
+    with open(path, encoding="utf-8") as f:
+        while True:
+            line = f.readline()
+            if line.endswith("\n") or (line and not follow):
+                line, pending = pending + line, ""
+                if line.strip():
+                    yield json.loads(line)
+            elif line:
+                pending += line
+            elif follow:
+                time.sleep(poll_seconds)
+                yield None
+            else:
+                return
+
+
+def events_from_queue(q, sentinel=None, timeout=None, heartbeat=HEARTBEAT_SECONDS):
+    # local queue.Queue / multiprocessing.Queue; stops at sentinel (or after timeout with no events).
+    # Yields None every heartbeat seconds while the queue is empty.
+    idle_since = time.monotonic()
+    while True:
+        try:
+            event = q.get(timeout=heartbeat)
+        except queue.Empty:
+            if timeout is not None and time.monotonic() - idle_since >= timeout:
+                return
+            yield None
+            continue
+        idle_since = time.monotonic()
+        if event is sentinel:
+            return
+        yield event
+
+
+def synthetic_events(bank_ids, n_events=100_000, seed=RANDOM_SEED, default_prob=0.01, balance_prob=0.2):
+    """Seeded intraday flow: mostly originations, plus paydowns and defaults on loans seen so far."""
+    rng = np.random.default_rng(seed)
+    bank_ids = list(bank_ids)
+    live = []   # (loan_id, bal) originated in this stream
+    for i in range(n_events):
+        u = rng.random()
+        if live and u < default_prob:
+            loan_id, _ = live[int(rng.integers(len(live)))]
+            yield {"type": "default", "loan_id": loan_id}
+        elif live and u < default_prob + balance_prob:
+            j = int(rng.integers(len(live)))
+            loan_id, bal = live[j]
+            bal = round(bal * rng.uniform(0.9, 1.0), 2)
+            live[j] = (loan_id, bal)
+            yield {"type": "balance", "loan_id": loan_id, "current_bal": bal}
+        else:
+            bal = round(rng.uniform(10000, 5000000) * rng.uniform(0.5, 1.0), 2)
+            loan_id = f"S{i}"
+            live.append((loan_id, bal))
+            yield {"type": "originate", "loan_id": loan_id, "bank_id": bank_ids[int(rng.integers(len(bank_ids)))],
+                   "current_bal": bal, "risk_weight": 0.5,
+                   "seg_code": SEG_CODES[int(rng.integers(len(SEG_CODES)))], "default_flag": False}
+
+
+if __name__ == "__main__":
+    as_of = date.today()
+    opening = load_opening(as_of)
+    for n, (bank_id, m) in enumerate(stream_metrics(synthetic_events(opening), as_of, opening), start=1):
+        if n % SNAPSHOT_EVERY == 0:
+            print(f"{n} events | bank {bank_id}: LDR={m['ldr']} NPL%={m['npl_pct']} CAR={m['car']}")
@@ -0,0 +1,223 @@
+# app.py
+# Bank Stress Lab dashboard: streamlit run app.py (from 02_bank_stress_lab/)
+# Reads only pre-aggregated tables (bank_metrics, loan_daily_rollup, bank_stress_results,
+# bank_liquidity_results) - never loan_portfolio - so page loads don't grow with the loan book.
+from dotenv import load_dotenv
+load_dotenv()
+
+from datetime import date
+
+import pandas as pd
+import plotly.express as px
+import streamlit as st
+
+from analytics.db import get_conn
+from analytics import scenarios
+
+
+# ------------------------------------------------------------------
+# Config
+# ------------------------------------------------------------------
+DEFAULT_AS_OF = date(2025, 7, 23)
+st.set_page_config(page_title="Bank Stress Lab", layout="wide")
+
+
+# ------------------------------------------------------------------
+# Data Loaders (cached, keyed by their arguments)
+# ------------------------------------------------------------------
+def read_sql(sql, params=None) -> pd.DataFrame:
+    with get_conn() as conn:
+        return pd.read_sql(sql, conn, params=params)
+
+
+@st.cache_data(ttl=300, show_spinner=False)
+def load_banks() -> pd.DataFrame:
+    return read_sql("SELECT bank_id, bank_name FROM banks ORDER BY bank_id;")
+
+
+@st.cache_data(ttl=300, show_spinner=False)
+def load_metrics_history(start: date, end: date, bank_ids: tuple) -> pd.DataFrame:
+    """LDR / NPL% / CAR per bank per day from bank_metrics."""
+    df = read_sql(
+        """
+        SELECT as_of, bank_id, loans_amt, deposits_amt, npl_amt, ldr, npl_pct, car
+        FROM bank_metrics
+        WHERE as_of BETWEEN %s AND %s AND bank_id = ANY(%s)
+        ORDER BY as_of, bank_id;
+        """,
+        params=[start, end, list(bank_ids)],
+    )
+    return ensure_numeric(df, ["loans_amt", "deposits_amt", "npl_amt", "ldr", "npl_pct", "car"])
+
+
+@st.cache_data(ttl=300, show_spinner=False)
+def load_segment_breakdown(as_of: date, bank_ids: tuple) -> pd.DataFrame:
+    """Book up to as_of by bank x segment from loan_daily_rollup."""
+    df = read_sql(
+        """
+        SELECT bank_id, seg_code,
+               SUM(loan_count) AS loan_count,
+               SUM(balance) AS balance,
+               SUM(npl_balance) AS npl_balance
+        FROM loan_daily_rollup
+        WHERE loan_date <= %s AND bank_id = ANY(%s)
+        GROUP BY bank_id, seg_code
+        ORDER BY bank_id, seg_code;
+        """,
+        params=[as_of, list(bank_ids)],
+    )
+    df = ensure_numeric(df, ["loan_count", "balance", "npl_balance"])
+    df["npl_pct"] = df["npl_balance"] / df["balance"].where(df["balance"] > 0)
+    return df
+
+
+@st.cache_data(ttl=300, show_spinner=False)
+def load_stress_results(as_of: date, bank_ids: tuple) -> pd.DataFrame:
+    df = read_sql(
+        """
+        SELECT r.scenario_id, r.bank_id, r.ldr, r.npl_pct, r.car, s.runoff,
+               s.pd_mult ->> 'Retail' AS pd_mult_retail, s.lgd ->> 'Retail' AS lgd_retail
+        FROM bank_stress_results r
+        JOIN stress_scenarios s ON s.scenario_id = r.scenario_id
+        WHERE r.as_of = %s AND r.bank_id = ANY(%s);
+        """,
+        params=[as_of, list(bank_ids)],
+    )
+    return ensure_numeric(df, ["ldr", "npl_pct", "car", "runoff", "pd_mult_retail", "lgd_retail"])
+
+
+@st.cache_data(ttl=300, show_spinner=False)
+def load_liquidity_results(as_of: date, bank_ids: tuple) -> pd.DataFrame:
+    df = read_sql(
+        """
+        SELECT bank_id, scenario, lcr, survival_days_p5, survival_days_median, breach_prob
+        FROM bank_liquidity_results
+        WHERE as_of = %s AND bank_id = ANY(%s)
+        ORDER BY bank_id, scenario;
+        """,
+        params=[as_of, list(bank_ids)],
+    )
+    return ensure_numeric(df, ["lcr", "survival_days_p5", "survival_days_median", "breach_prob"])
+
+
+@st.cache_resource(ttl=300, show_spinner=False)
+def load_book(as_of: date):
+    # (bank x segment) arrays from the rollup; shared across sessions, not copied per rerun
+    return scenarios.load_bank_book(as_of)
+
+
+@st.cache_data(ttl=300, show_spinner=False)
+def run_custom_scenario(as_of: date, pd_mult: float, lgd: float, rw_mult: float, runoff: float) -> pd.DataFrame:
+    book = load_book(as_of)
+    grid = scenarios.scenario_grid(pd_mults=(pd_mult,), lgds=(lgd,), rw_mults=(rw_mult,), runoffs=(runoff,))
+    res = scenarios.run_stress(book, grid)
+    return pd.DataFrame({
+        "bank_id": book["bank_ids"],
+        "ldr": res["ldr"][0],
+        "npl_pct": res["npl_pct"][0],
+        "car": res["car"][0],
+        "capital": res["capital"][0],
+    })
+
+
+def ensure_numeric(df: pd.DataFrame, cols):
+    for c in cols:
+        if c in df.columns:
+            df[c] = pd.to_numeric(df[c], errors="coerce")
+    return df
+
+
+# ------------------------------------------------------------------
+# Layout: sidebar controls
+# ------------------------------------------------------------------
+st.title("🏦 Bank Stress Lab")
+
+banks_df = load_banks()
+bank_names = dict(zip(banks_df["bank_id"], banks_df["bank_name"]))
+
+as_of_date = st.sidebar.date_input("As of", value=DEFAULT_AS_OF)
+history_start = st.sidebar.date_input("History from", value=date(as_of_date.year, as_of_date.month, 1))
+selected_banks = st.sidebar.multiselect(
+    "Banks", list(bank_names), default=list(bank_names), format_func=lambda b: bank_names.get(b, str(b))
+)
+bank_key = tuple(sorted(selected_banks))
+
+view = st.sidebar.radio("View", ["Metrics History", "Segments", "Stress Scenarios", "Liquidity"])
+
+
+def with_names(df: pd.DataFrame) -> pd.DataFrame:
+    df = df.copy()
+    df["bank"] = df["bank_id"].map(bank_names)
+    return df
+
+
+# ------------------------------------------------------------------
+# Views (only the selected one runs)
+# ------------------------------------------------------------------
+if not bank_key:
+    st.info("Select at least one bank in the sidebar.")
+
+elif view == "Metrics History":
+    st.subheader("LDR / NPL% / CAR History")
+    hist = with_names(load_metrics_history(history_start, as_of_date, bank_key))
+    if hist.empty:
+        st.warning("No bank_metrics rows in this window.")
+    else:
+        for col, title in (("ldr", "Loan-to-Deposit Ratio"), ("npl_pct", "NPL %"), ("car", "Capital Adequacy Ratio")):
+            st.plotly_chart(px.line(hist, x="as_of", y=col, color="bank", title=title), use_container_width=True)
+        st.write("### Latest")
+        st.dataframe(hist[hist["as_of"] == hist["as_of"].max()], use_container_width=True)
+
+elif view == "Segments":
+    st.subheader(f"Segment Breakdown (book up to {as_of_date})")
+    seg = with_names(load_segment_breakdown(as_of_date, bank_key))
+    if seg.empty:
+        st.warning("No loans in loan_daily_rollup for this selection.")
+    else:
+        st.plotly_chart(px.bar(seg, x="bank", y="balance", color="seg_code", title="Balance by Segment"),
+                        use_container_width=True)
+        st.plotly_chart(px.bar(seg, x="seg_code", y="npl_pct", color="bank", barmode="group", title="NPL % by Segment"),
+                        use_container_width=True)
+        st.dataframe(seg, use_container_width=True)
+
+elif view == "Stress Scenarios":
+    st.subheader("Stress Scenarios")
+
+    st.write("### Custom scenario (computed on demand)")
+    c1, c2, c3, c4 = st.columns(4)
+    pd_mult = c1.slider("PD multiplier", 1.0, 10.0, 2.0, 0.5)
+    lgd = c2.slider("LGD", 0.0, 1.0, 0.45, 0.05)
+    rw_mult = c3.slider("Risk-weight migration", 1.0, 2.0, 1.2, 0.1)
+    runoff = c4.slider("Deposit run-off", 0.0, 0.5, 0.10, 0.05)
+    custom = with_names(run_custom_scenario(as_of_date, pd_mult, lgd, rw_mult, runoff))
+    custom = custom[custom["bank_id"].isin(bank_key)]
+    st.dataframe(custom, use_container_width=True)
+
+    st.write("### Stored scenario grid (bank_stress_results)")
+    stress = with_names(load_stress_results(as_of_date, bank_key))
+    if stress.empty:
+        st.info("No stored stress results for this date — run analytics.scenarios.")
+    else:
+        st.plotly_chart(px.box(stress, x="bank", y="car", title="CAR across scenarios"), use_container_width=True)
+        # banks without risk-weighted loans have NULL CAR in every scenario: nothing to rank
+        rated = stress.dropna(subset=["car"])
+        worst = rated.loc[rated.groupby("bank_id")["car"].idxmin()]
+        st.write("### Worst CAR scenario per bank")
+        st.dataframe(worst, use_container_width=True)
+
+elif view == "Liquidity":
+    st.subheader("Liquidity Run-off")
+    liq = with_names(load_liquidity_results(as_of_date, bank_key))
+    if liq.empty:
+        st.info("No liquidity results for this date — run analytics.liquidity.")
+    else:
+        st.plotly_chart(px.bar(liq, x="bank", y="survival_days_p5", color="scenario", barmode="group",
+                               title="Survival days (worst 5% of paths)"), use_container_width=True)
+        st.dataframe(liq, use_container_width=True)
+
+
+# ------------------------------------------------------------------
+# Footer
+# ------------------------------------------------------------------
+st.write("---")
+st.caption("Bank Stress Lab — reads aggregate tables only")
@@ -0,0 +1,32 @@
+-- 01_create_bank_stress_results.sql
+-- Bank Stress Lab
+-- Creates stress_scenarios (scenario grid parameters) and bank_stress_results
+-- (stressed LDR / NPL% / CAR per as_of, scenario and bank).
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS stress_scenarios (
+    scenario_id BIGINT PRIMARY KEY,     -- hash of the parameters (analytics.scenarios.scenario_id)
+    pd_mult JSONB NOT NULL,             -- default-rate multiplier by seg_code
+    lgd JSONB NOT NULL,                 -- loss-given-default by seg_code
+    rw_mult JSONB NOT NULL,             -- risk-weight migration multiplier by seg_code
+    runoff NUMERIC(6,4) NOT NULL,       -- deposit run-off, 0.10 = 10%
+    created_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+CREATE TABLE IF NOT EXISTS bank_stress_results (
+    as_of DATE NOT NULL,
+    scenario_id BIGINT NOT NULL,
+    bank_id INT NOT NULL,
+    loans_amt NUMERIC(20,2),
+    deposits_amt NUMERIC(20,2),
+    npl_amt NUMERIC(20,2),
+    capital_amt NUMERIC(20,2),
+    rwa_amt NUMERIC(20,2),
+    ldr NUMERIC(12,6),
+    npl_pct NUMERIC(12,6),
+    car NUMERIC(12,6),
+    PRIMARY KEY (as_of, scenario_id, bank_id)
+);
+
+COMMIT;
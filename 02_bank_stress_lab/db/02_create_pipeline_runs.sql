@@ -0,0 +1,23 @@
+-- 02_create_pipeline_runs.sql
+-- Bank Stress Lab
+-- Creates pipeline_runs: one row per stage per refresh_all run, with timings,
+-- input-table fingerprint (used to skip unchanged stages) and output row counts.
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS pipeline_runs (
+    run_id BIGSERIAL PRIMARY KEY,
+    refresh_id TEXT NOT NULL,            -- groups the stages of one refresh
+    stage TEXT NOT NULL,
+    status TEXT NOT NULL,                -- ok / failed / skipped / blocked
+    started_at TIMESTAMPTZ NOT NULL,
+    finished_at TIMESTAMPTZ NOT NULL,
+    duration_s NUMERIC(12,3),
+    input_fingerprint JSONB,
+    output_rows JSONB,                   -- {table: live rows (pg_stat estimate)}
+    error TEXT
+);
+
+CREATE INDEX IF NOT EXISTS pipeline_runs_stage_idx ON pipeline_runs (stage, finished_at DESC);
+
+COMMIT;
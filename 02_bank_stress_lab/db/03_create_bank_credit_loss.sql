@@ -0,0 +1,21 @@
+-- 03_create_bank_credit_loss.sql
+-- Bank Stress Lab
+-- Creates bank_credit_loss: simulated credit loss distribution summary per
+-- as_of, bank and confidence level (analytics/credit_loss.py).
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS bank_credit_loss (
+    as_of DATE NOT NULL,
+    bank_id INT NOT NULL,
+    confidence NUMERIC(6,4) NOT NULL,    -- 0.9990 = 99.9%
+    n_scenarios INT NOT NULL,
+    exposure_amt NUMERIC(20,2),          -- performing balance simulated
+    el_amt NUMERIC(20,2),                -- expected loss
+    ul_amt NUMERIC(20,2),                -- unexpected loss (std dev)
+    var_amt NUMERIC(20,2),               -- credit VaR (loss quantile)
+    es_amt NUMERIC(20,2),                -- expected shortfall (tail mean)
+    PRIMARY KEY (as_of, bank_id, confidence)
+);
+
+COMMIT;
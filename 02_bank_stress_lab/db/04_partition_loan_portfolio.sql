@@ -0,0 +1,126 @@
+-- 04_partition_loan_portfolio.sql
+-- Bank Stress Lab
+-- Migrates loan_portfolio to a table range-partitioned by loan_date (one
+-- partition per month, plus a default partition for out-of-range rows).
+-- New months are added by analytics/partitions.ensure_partitions (data_generator
+-- calls it before loading); old months can be detached or archived from there too.
+--
+-- LIKE copies neither the primary key nor foreign keys, so both are recreated
+-- after the copy: the key gains loan_date (a partitioned table's unique keys must
+-- include the partition column), which also makes loan_date NOT NULL. Loans without
+-- a loan_date therefore stop the migration before anything changes: give them a date
+-- first (e.g. UPDATE loan_portfolio SET loan_date = <booking date> WHERE loan_date IS NULL).
+-- Rollups, metrics and credit_loss rely on every loan being dated from here on.
+--
+-- The original table is kept as loan_portfolio_unpartitioned; drop it once the
+-- row counts below match.
+
+BEGIN;
+
+DO $$
+DECLARE
+    n bigint;
+BEGIN
+    SELECT COUNT(*) INTO n FROM loan_portfolio WHERE loan_date IS NULL;
+    IF n > 0 THEN
+        RAISE EXCEPTION '% loan_portfolio rows have no loan_date', n
+            USING HINT = 'Backfill loan_date for these loans, then re-run this migration (the partitioned table requires it).';
+    END IF;
+END $$;
+
+ALTER TABLE loan_portfolio RENAME TO loan_portfolio_unpartitioned;
+
+CREATE TABLE loan_portfolio (
+    LIKE loan_portfolio_unpartitioned INCLUDING DEFAULTS INCLUDING CONSTRAINTS
+) PARTITION BY RANGE (loan_date);
+
+-- serial columns: hand the sequence over so dropping the old table keeps it
+DO $$
+DECLARE
+    r record;
+BEGIN
+    FOR r IN
+        SELECT a.attname, pg_get_serial_sequence('loan_portfolio_unpartitioned', a.attname) AS seq
+        FROM pg_attribute a
+        WHERE a.attrelid = 'loan_portfolio_unpartitioned'::regclass
+          AND a.attnum > 0 AND NOT a.attisdropped
+    LOOP
+        IF r.seq IS NOT NULL THEN
+            EXECUTE format('ALTER SEQUENCE %s OWNED BY loan_portfolio.%I', r.seq, r.attname);
+        END IF;
+    END LOOP;
+END $$;
+
+CREATE TABLE loan_portfolio_default PARTITION OF loan_portfolio DEFAULT;
+
+-- monthly partitions covering the existing data
+DO $$
+DECLARE
+    m date;
+    last_month date;
+BEGIN
+    SELECT date_trunc('month', MIN(loan_date))::date, date_trunc('month', MAX(loan_date))::date
+    INTO m, last_month
+    FROM loan_portfolio_unpartitioned;
+
+    WHILE m IS NOT NULL AND m <= last_month LOOP
+        EXECUTE format(
+            'CREATE TABLE %I PARTITION OF loan_portfolio FOR VALUES FROM (%L) TO (%L)',
+            'loan_portfolio_p' || to_char(m, 'YYYY_MM'), m, (m + interval '1 month')::date
+        );
+        m := (m + interval '1 month')::date;
+    END LOOP;
+END $$;
+
+INSERT INTO loan_portfolio SELECT * FROM loan_portfolio_unpartitioned;
+
+-- keys dropped by LIKE: primary key (+ loan_date) and the foreign key to banks,
+-- taken from the original table so column names stay whatever they were there
+DO $$
+DECLARE
+    pk_cols text;
+    r record;
+BEGIN
+    SELECT string_agg(quote_ident(a.attname), ', ' ORDER BY k.ord)
+    INTO pk_cols
+    FROM pg_constraint c
+    CROSS JOIN LATERAL unnest(c.conkey) WITH ORDINALITY AS k(attnum, ord)
+    JOIN pg_attribute a ON a.attrelid = c.conrelid AND a.attnum = k.attnum
+    WHERE c.conrelid = 'loan_portfolio_unpartitioned'::regclass
+      AND c.contype = 'p'
+      AND a.attname <> 'loan_date';
+
+    IF pk_cols IS NULL THEN
+        RAISE NOTICE 'loan_portfolio_unpartitioned has no primary key; falling back to (loan_id, loan_date)';
+        pk_cols := 'loan_id';
+    END IF;
+    EXECUTE format('ALTER TABLE loan_portfolio ADD PRIMARY KEY (%s, loan_date)', pk_cols);
+
+    FOR r IN
+        SELECT pg_get_constraintdef(c.oid) AS def
+        FROM pg_constraint c
+        WHERE c.conrelid = 'loan_portfolio_unpartitioned'::regclass
+          AND c.contype = 'f'
+    LOOP
+        EXECUTE format('ALTER TABLE loan_portfolio ADD %s', r.def);
+    END LOOP;
+
+    IF NOT EXISTS (
+        SELECT 1 FROM pg_constraint
+        WHERE conrelid = 'loan_portfolio'::regclass AND contype = 'f' AND confrelid = 'banks'::regclass
+    ) THEN
+        ALTER TABLE loan_portfolio ADD FOREIGN KEY (bank_id) REFERENCES banks (bank_id);
+    END IF;
+END $$;
+
+-- created on the parent, so every current and future partition gets them
+CREATE INDEX loan_portfolio_bank_date_idx ON loan_portfolio (bank_id, loan_date);
+CREATE INDEX loan_portfolio_date_idx ON loan_portfolio (loan_date);
+
+COMMIT;
+
+ANALYZE loan_portfolio;
+
+-- Check:
+-- SELECT (SELECT COUNT(*) FROM loan_portfolio) AS partitioned,
+--        (SELECT COUNT(*) FROM loan_portfolio_unpartitioned) AS original;
@@ -0,0 +1,39 @@
+-- 05_create_loan_daily_rollup.sql
+-- Bank Stress Lab
+-- Creates loan_daily_rollup: loan_portfolio aggregated by (bank_id, loan_date, seg_code).
+-- Kept current by analytics/rollups.refresh_rollup_days (data_generator calls it per
+-- loaded day); metrics, scenarios and the dashboard read this instead of raw loans.
+-- Every loan is dated (loan_date is NOT NULL since 04_partition_loan_portfolio.sql).
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS loan_daily_rollup (
+    bank_id INT NOT NULL,
+    loan_date DATE NOT NULL,
+    seg_code TEXT NOT NULL,
+    loan_count BIGINT NOT NULL,
+    balance NUMERIC(20,2) NOT NULL,
+    rw_balance NUMERIC(20,2) NOT NULL,       -- SUM(current_bal * risk_weight)
+    npl_balance NUMERIC(20,2) NOT NULL,      -- defaulted balance
+    npl_rw_balance NUMERIC(20,2) NOT NULL,   -- defaulted risk-weighted balance
+    PRIMARY KEY (bank_id, loan_date, seg_code)
+);
+
+CREATE INDEX IF NOT EXISTS loan_daily_rollup_date_idx ON loan_daily_rollup (loan_date);
+
+-- backfill from existing loans
+TRUNCATE loan_daily_rollup;
+INSERT INTO loan_daily_rollup
+    (bank_id, loan_date, seg_code, loan_count, balance, rw_balance, npl_balance, npl_rw_balance)
+SELECT bank_id, loan_date, COALESCE(seg_code, 'UNKNOWN'),
+    COUNT(*),
+    SUM(current_bal),
+    SUM(current_bal * risk_weight),
+    COALESCE(SUM(current_bal) FILTER (WHERE default_flag), 0),
+    COALESCE(SUM(current_bal * risk_weight) FILTER (WHERE default_flag), 0)
+FROM loan_portfolio
+GROUP BY 1, 2, 3;
+
+COMMIT;
+
+ANALYZE loan_daily_rollup;
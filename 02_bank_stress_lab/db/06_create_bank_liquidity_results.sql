@@ -0,0 +1,24 @@
+-- 06_create_bank_liquidity_results.sql
+-- Bank Stress Lab
+-- Creates bank_liquidity_results: deposit run-off stress per as_of, bank and
+-- liquidity scenario (analytics/liquidity.py).
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS bank_liquidity_results (
+    as_of DATE NOT NULL,
+    bank_id INT NOT NULL,
+    scenario TEXT NOT NULL,              -- base / moderate / severe / bank_run
+    deposits_amt NUMERIC(20,2),
+    liquid_assets_amt NUMERIC(20,2),     -- deposits + capital - loans, floored at 0
+    outflow_30d_amt NUMERIC(20,2),       -- 95th percentile cumulative 30-day outflow
+    lcr NUMERIC(14,6),                   -- liquid assets / stressed 30-day outflow
+    survival_days_p5 NUMERIC(6,1),       -- worst 5% of paths
+    survival_days_median NUMERIC(6,1),
+    breach_prob NUMERIC(8,6),            -- share of paths breaching within horizon_days
+    n_paths INT,
+    horizon_days INT,
+    PRIMARY KEY (as_of, bank_id, scenario)
+);
+
+COMMIT;
@@ -0,0 +1,288 @@
+# Pure-numpy checks of the analytics (no database needed).
+from dataclasses import replace
+from datetime import date, timedelta
+
+import numpy as np
+import pytest
+
+from analytics import credit_loss, data_generator, liquidity, refresh_all, scenarios, simulate_daily_loans
+from analytics.simulate_daily_deposits import deposits_for_dates, simulate_deposit_paths
+
+
+# ------------------------------------------------------------------
+# scenarios
+# ------------------------------------------------------------------
+def _book_rows():
+    # (bank_id, deposits, capital, seg_code, loans, rw_loans, npl_amt, npl_rw)
+    return [
+        (1, 5e9, 4e8, "Retail", 2e9, 1.1e9, 1e8, 1e8),
+        (1, 5e9, 4e8, "Corporate", 1e9, 0.9e9, 5e7, 5e7),
+        (2, 8e8, 9e7, "SME", 6e8, 4e8, 6e7, 6e7),
+        (3, 1e9, 2e8, None, None, None, None, None),    # bank without loans
+    ]
+
+
+def test_neutral_scenario_reproduces_base_metrics():
+    rows = _book_rows()
+    book = scenarios._book_from_rows(rows)
+    grid = scenarios.scenario_grid(pd_mults=(1.0,), lgds=(0.0,), rw_mults=(1.0,), runoffs=(0.0,))
+    out = scenarios.run_stress(book, grid)
+
+    for i, bank_id in enumerate(book["bank_ids"]):
+        bank = [r for r in rows if r[0] == bank_id and r[3] is not None]
+        loans = sum(r[4] for r in bank)
+        deposits, capital = next(r[1:3] for r in rows if r[0] == bank_id)
+        if not loans:
+            assert np.isnan(out["ldr"][0, i]) and np.isnan(out["car"][0, i])
+            continue
+        assert out["ldr"][0, i] == pytest.approx(loans / deposits)
+        assert out["npl_pct"][0, i] == pytest.approx(sum(r[6] for r in bank) / loans)
+        assert out["car"][0, i] == pytest.approx(capital / sum(r[5] for r in bank))
+
+
+def test_scenario_ids_depend_only_on_parameters():
+    full = scenarios.scenario_grid()
+    small = scenarios.scenario_grid(pd_mults=(2.0,), lgds=(0.45,), rw_mults=(1.2,), runoffs=(0.10,))
+    ids = [scenarios.scenario_id(scenarios._params(full, s)) for s in range(len(full["runoff"]))]
+    assert len(set(ids)) == len(ids)
+    assert all(0 <= i < 2 ** 63 for i in ids)
+    assert scenarios.scenario_id(scenarios._params(small, 0)) in ids
+
+
+# ------------------------------------------------------------------
+# simulate_daily_deposits
+# ------------------------------------------------------------------
+def test_deposit_walk_matches_floored_loop():
+    base = np.array([1e9, 5e8, 2e7])
+    bank_ids = [3, 7, 11]
+    floor, n_days = 0.7, 400
+    paths = simulate_deposit_paths(base, n_days, drift=-0.002, volatility=0.01, floor=floor,
+                                   seed=5, bank_ids=bank_ids)
+
+    for i, bank_id in enumerate(bank_ids):
+        rng = np.random.default_rng(np.random.SeedSequence(5, spawn_key=(bank_id,)))
+        steps = rng.normal(-0.002, 0.01, size=n_days)
+        d, expected = base[i], []
+        for r in steps:
+            d = max(d * np.exp(r), floor * base[i])
+            expected.append(round(d, 2))
+        np.testing.assert_allclose(paths[i], expected, rtol=1e-9)
+    assert (paths >= np.round(floor * base[:, None], 2)).all()
+
+
+def test_deposits_are_fixed_per_calendar_date():
+    base, ids, epoch = [1e9, 2e9], [1, 2], date(2025, 7, 1)
+    days = lambda first, n: [first + timedelta(days=i) for i in range(n)]
+    july = deposits_for_dates(base, days(date(2025, 7, 10), 30), bank_ids=ids, epoch=epoch)
+    # first loan date moved later, earlier, or more days / banks: the same dates keep their values
+    later = deposits_for_dates(base, days(date(2025, 7, 20), 20), bank_ids=ids, epoch=epoch)
+    earlier = deposits_for_dates(base, days(date(2025, 6, 20), 60), bank_ids=ids, epoch=epoch)
+    more_banks = deposits_for_dates(base + [3e9], days(date(2025, 7, 10), 30), bank_ids=ids + [3], epoch=epoch)
+    np.testing.assert_array_equal(later, july[:, 10:])
+    np.testing.assert_array_equal(earlier[:, 20:50], july)
+    np.testing.assert_array_equal(more_banks[:2], july)
+    np.testing.assert_array_equal(earlier[:, :11], np.repeat(np.array(base)[:, None], 11, axis=1))
+
+
+# ------------------------------------------------------------------
+# data_generator
+# ------------------------------------------------------------------
+def test_loan_shards_are_keyed_by_calendar_date_and_bank():
+    a = data_generator.generate_shard(2, date(2025, 7, 5))
+    again = data_generator.generate_shard(2, date(2025, 7, 5))
+    other_day = data_generator.generate_shard(2, date(2025, 7, 6))
+    other_bank = data_generator.generate_shard(3, date(2025, 7, 5))
+    for key in ("orig_amt", "current_bal", "default_flag", "seg_idx"):
+        np.testing.assert_array_equal(a[key], again[key])
+    assert not np.array_equal(a["orig_amt"][:10], other_day["orig_amt"][:10])
+    assert not np.array_equal(a["orig_amt"][:10], other_bank["orig_amt"][:10])
+
+
+# ------------------------------------------------------------------
+# credit_loss
+# ------------------------------------------------------------------
+def _loans(n=3000, seed=0):
+    rng = np.random.default_rng(seed)
+    segs = np.array(credit_loss.SEG_CODES)
+    return dict(
+        bank_id=rng.integers(1, 6, size=n),
+        seg_code=segs[rng.integers(len(segs), size=n)],
+        current_bal=rng.uniform(1e4, 1e6, size=n),
+        default_flag=rng.random(n) < 0.05,
+    )
+
+
+def test_credit_loss_independent_of_worker_count():
+    portfolio = credit_loss.prepare_portfolio(_loans())
+    kwargs = dict(n_scenarios=500, seed=7, scenario_chunk=128, loan_chunk=700)
+    serial = credit_loss.simulate_losses(portfolio, workers=1, **kwargs)
+    parallel = credit_loss.simulate_losses(portfolio, workers=2, **kwargs)
+    assert serial.shape == (500, len(portfolio["bank_ids"]))
+    np.testing.assert_array_equal(serial, parallel)
+
+
+def test_loss_statistics_are_ordered():
+    losses = credit_loss.simulate_losses(credit_loss.prepare_portfolio(_loans()), n_scenarios=2000,
+                                         seed=3, workers=1, scenario_chunk=500)
+    stats = credit_loss.loss_statistics(losses, (0.95, 0.99))
+    assert (stats["var"][0.95] <= stats["var"][0.99]).all()
+    assert (stats["var"][0.99] <= stats["es"][0.99]).all()
+    assert (stats["el"] <= stats["es"][0.95]).all()
+
+
+# ------------------------------------------------------------------
+# liquidity
+# ------------------------------------------------------------------
+def _liquidity_inputs():
+    rng = np.random.default_rng(1)
+    steps = rng.normal(0.0, 0.003, size=(4, 31))
+    history = 1e9 * np.exp(np.cumsum(steps, axis=1))
+    history[3] = np.nan                                     # no deposit history at all
+    return dict(
+        bank_ids=np.array([1, 2, 3, 4]),
+        history=history,
+        capital=np.array([1e8, 2e9, 5e7, 1e8]),
+        deposits=np.array([history[0, -1], history[1, -1], history[2, -1], np.nan]),
+        loans=np.array([2e9, 1e8, 1.0e9, 5e8]),
+    )
+
+
+def test_liquidity_stress_shapes_and_edge_banks():
+    inputs = _liquidity_inputs()
+    out = liquidity.run_liquidity_stress(inputs, n_paths=400, horizon=60, lcr_days=30)
+    assert set(out) == set(liquidity.LIQUIDITY_SCENARIOS)
+    for name, res in out.items():
+        # bank 2 keeps more liquidity than it has deposits: nothing can run it dry
+        assert res["breach_prob"][1] == 0 and res["survival_p5"][1] == 60
+        # bank 4 has no deposits row: unknown, not "survives the horizon"
+        assert all(np.isnan(res[k][3]) for k in res)
+        assert (res["breach_prob"][:3] >= 0).all() and (res["breach_prob"][:3] <= 1).all()
+        np.testing.assert_allclose(res["lcr"][:3], res["liquid_assets"][:3] / res["outflow_lcr"][:3])
+    # bank 1 has no liquid assets (loans > deposits + capital): breached almost at once
+    assert out["base"]["breach_prob"][0] > 0.9
+    assert out["bank_run"]["breach_prob"][2] >= out["base"]["breach_prob"][2]
+
+
+def test_liquidity_stress_is_reproducible():
+    inputs = _liquidity_inputs()
+    a = liquidity.run_liquidity_stress(inputs, n_paths=200, horizon=40, lcr_days=20, seed=9)
+    b = liquidity.run_liquidity_stress(inputs, n_paths=200, horizon=40, lcr_days=20, seed=9)
+    for name in a:
+        for key in a[name]:
+            np.testing.assert_array_equal(a[name][key], b[name][key])
+
+
+# ------------------------------------------------------------------
+# simulate_daily_loans
+# ------------------------------------------------------------------
+def _running(max_loans=10):
+    opening = {1: dict(loans=1000.0, rw_loans=500.0, npl_amt=0.0, deposits=2000.0, capital=100.0)}
+    return simulate_daily_loans.RunningBankMetrics(opening, max_loans=max_loans)
+
+
+def _originate(loan_id, bank_id, bal, rw=0.5):
+    return dict(type="originate", loan_id=loan_id, bank_id=bank_id, current_bal=bal, risk_weight=rw)
+
+
+def test_running_metrics_follow_loan_events():
+    running = _running()
+    running.apply(_originate(10, 1, 200.0))
+    running.apply(dict(type="balance", loan_id=10, current_bal=150.0))
+    running.apply(dict(type="default", loan_id=10))
+    m = running.metrics(1)
+    assert m["loans_amt"] == 1150.0 and m["npl_amt"] == 150.0
+    assert m["ldr"] == pytest.approx(1150.0 / 2000.0)
+    assert m["npl_pct"] == pytest.approx(150.0 / 1150.0)
+    assert m["car"] == pytest.approx(100.0 / (500.0 + 150.0 * simulate_daily_loans.DEFAULT_RISK_WEIGHT))
+
+    # paid-off loans are forgotten; later events for them are unmatched
+    running.apply(dict(type="balance", loan_id=10, current_bal=0.0))
+    assert 10 not in running.loans and running.metrics(1)["npl_amt"] == 0.0
+    assert running.apply(dict(type="default", loan_id=10)) is None and running.unmatched == 1
+
+    # untracked loans carry their old state in the event
+    running.apply(dict(type="balance", loan_id=99, bank_id=1, old_bal=300.0, risk_weight=1.0, current_bal=100.0))
+    assert running.metrics(1)["loans_amt"] == 800.0 and running.dirty == {1}
+
+    with pytest.raises(ValueError, match="Unknown event"):
+        running.apply(dict(type="close", loan_id=1))
+
+
+def test_running_metrics_unknown_bank_and_lru():
+    running = _running(max_loans=2)
+    for loan_id in (1, 2, 3):
+        running.apply(_originate(loan_id, 7, 100.0))
+    assert list(running.loans) == [2, 3]
+    # bank 7 is not in the opening book: no deposits or capital, so no LDR / CAR
+    m = running.metrics(7)
+    assert m["loans_amt"] == 300.0 and m["ldr"] is None and m["car"] is None
+    assert m["npl_pct"] == 0.0
+
+    running.apply(dict(type="balance", loan_id=2, current_bal=50.0))
+    running.apply(_originate(4, 7, 100.0))
+    assert list(running.loans) == [2, 4]
+
+
+def test_stream_metrics_skips_heartbeats(monkeypatch):
+    snapshots = []
+    monkeypatch.setattr(simulate_daily_loans, "snapshot",
+                        lambda running, as_of: snapshots.append(set(running.dirty)) or running.dirty.clear())
+    events = [_originate(1, 1, 10.0), None, dict(type="default", loan_id=5), _originate(2, 1, 5.0)]
+    out = list(simulate_daily_loans.stream_metrics(events, as_of=date(2025, 7, 1), opening=_running().totals,
+                                                   snapshot_every=2))
+    assert [b for b, _ in out] == [1, 1] and out[-1][1]["loans_amt"] == 1015.0
+    assert snapshots == [{1}, {1}]
+
+
+def test_events_from_file_waits_for_complete_lines(tmp_path, monkeypatch):
+    path = tmp_path / "events.jsonl"
+    path.write_text('{"type": "default", "loan_id": 1}\n{"type": "default", ')
+    monkeypatch.setattr(simulate_daily_loans.time, "sleep", lambda s: None)
+    events = simulate_daily_loans.events_from_file(path, follow=True)
+    assert next(events) == {"type": "default", "loan_id": 1}
+    assert next(events) is None                         # half a line on disk: keep waiting
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('"loan_id": 2}\n')
+    assert next(events) == {"type": "default", "loan_id": 2}
+
+    # without follow, a last line lacking its newline is still read
+    path.write_text('{"type": "default", "loan_id": 3}')
+    assert list(simulate_daily_loans.events_from_file(path)) == [{"type": "default", "loan_id": 3}]
+
+
+# ------------------------------------------------------------------
+# refresh_all
+# ------------------------------------------------------------------
+def test_build_dag_links_producers_and_rejects_cycles():
+    Stage = refresh_all.Stage
+    stages = [Stage("a", None, outputs=("t1",)), Stage("b", None, inputs=("t1", "src"), outputs=("t2",)),
+              Stage("c", None, inputs=("t2", "t1"))]
+    assert refresh_all.build_dag(stages) == {"a": set(), "b": {"a"}, "c": {"a", "b"}}
+
+    cyclic = [replace(stages[0], inputs=("t3",)), stages[1], replace(stages[2], outputs=("t3",))]
+    with pytest.raises(ValueError, match="Cycle"):
+        refresh_all.build_dag(cyclic)
+
+
+def test_default_stages_form_a_dag():
+    deps = refresh_all.build_dag(refresh_all.STAGES)
+    assert deps["metrics"] == {"loans", "deposits"}
+    assert deps["export"] == {"metrics"}
+
+
+def test_run_stage_skips_unchanged_inputs(monkeypatch):
+    calls, recorded = [], []
+    monkeypatch.setattr(refresh_all, "table_stats", lambda tables: {t: {"changes": 1, "live_rows": 1} for t in tables})
+    monkeypatch.setattr(refresh_all, "record_run", lambda *a, **k: recorded.append(a[2]))
+    stage = refresh_all.Stage("s", lambda: calls.append(1), inputs=("t",), outputs=("u",))
+
+    assert refresh_all.run_stage("r", stage, False, {"t": 1})["status"] == "skipped"
+    assert refresh_all.run_stage("r", stage, True, {"t": 1})["status"] == "ok"        # upstream ran
+    assert refresh_all.run_stage("r", stage, False, {"t": 0})["status"] == "ok"       # input changed
+    assert refresh_all.run_stage("r", stage, False, {"t": 1}, force=True)["status"] == "ok"
+    assert len(calls) == 3 and recorded == ["skipped", "ok", "ok", "ok"]
+
+
+def test_generator_stages_need_generate():
+    with pytest.raises(ValueError, match="generate"):
+        refresh_all.run_pipeline(only=["loans"])
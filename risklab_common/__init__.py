@@ -0,0 +1 @@
+# Code shared by 01_Bonds_risk and 02_bank_stress_lab (run with the repo root on PYTHONPATH).
@@ -0,0 +1,140 @@
+# risklab_common/parquet_export.py
+# Postgres query -> Parquet partitioned by date, shared by both projects:
+#   02_bank_stress_lab/analytics/export_parquet.py  (bank_metrics)
+#   01_Bonds_risk/src/export_parquet.py             (bond_risk_metrics)
+# Writes <root>/<name>/as_of=YYYY-MM-DD/part-0.parquet (zstd, explicit schema) plus
+# _manifest.json with the schema and, per partition, its row count and checksum.
+#
+# The checksum is an md5 of the partition's rows computed in Postgres. Only dates from the
+# latest exported one on (plus --since, plus manifest entries whose file has gone) are
+# fingerprinted, so a nightly run aggregates a day or two, not the whole history; only new
+# or changed dates among those are read and rewritten. Older dates are not re-checked:
+# after back-filling or correcting history, re-export it with since.
+
+import json
+import os
+from datetime import date, datetime, timezone
+from pathlib import Path
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+COMPRESSION = "zstd"
+MANIFEST = "_manifest.json"
+PART_FILE = "part-0.parquet"
+
+
+def partition_dir(root: Path, as_of: date) -> Path:
+    return root / f"as_of={as_of:%Y-%m-%d}"
+
+
+def exported_dates(root: Path) -> set:
+    """as_of dates already on disk (the part file is renamed into place last)."""
+    out = set()
+    for d in root.glob("as_of=*"):
+        if (d / PART_FILE).exists():
+            out.add(date.fromisoformat(d.name.split("=", 1)[1]))
+    return out
+
+
+def source_fingerprints(cur, base_sql: str, start: date = None, dates=()) -> dict:
+    """
+    {as_of: (rows, md5)} for the dates in base_sql (first column must be as_of) on or
+    after start, plus the listed dates; every date when start is None.
+    """
+    where, params = "", {}
+    if start is not None:
+        where = "WHERE t.as_of >= %(start)s OR t.as_of = ANY(%(dates)s::date[])"
+        params = {"start": start, "dates": list(dates)}
+    cur.execute(f"""
+        SELECT t.as_of, COUNT(*), md5(string_agg(t::text, '|' ORDER BY t::text))
+        FROM ({base_sql}) t
+        {where}
+        GROUP BY t.as_of
+        ORDER BY t.as_of;
+    """, params)
+    return {d: (n, checksum) for d, n, checksum in cur.fetchall()}
+
+
+def fingerprint_window(manifest: dict, done: set, since: date = None):
+    """
+    (start, missing) for source_fingerprints: the latest date exported and on disk (so a
+    re-run of that day is still noticed), moved back to since; start is None (check every
+    date) before the first export. missing: manifest dates whose part file is gone.
+    """
+    known = {date.fromisoformat(k) for k in manifest["partitions"]}
+    present = known & done
+    start = max(present) if present else None
+    if start is not None and since is not None:
+        start = min(start, since)
+    return start, sorted(known - done)
+
+
+def write_partition(cur, root: Path, base_sql: str, schema: pa.Schema, as_of: date) -> int:
+    order = schema.names[1]
+    cur.execute(f"SELECT * FROM ({base_sql}) t WHERE t.as_of = %s ORDER BY t.{order};", (as_of,))
+    rows = cur.fetchall()
+    columns = list(zip(*rows)) if rows else [[] for _ in schema]
+    table = pa.Table.from_arrays(
+        [pa.array(col, type=field.type) for col, field in zip(columns, schema)], schema=schema
+    )
+    out_dir = partition_dir(root, as_of)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    tmp = out_dir / (PART_FILE + ".tmp")
+    pq.write_table(table, tmp, compression=COMPRESSION)
+    os.replace(tmp, out_dir / PART_FILE)
+    return table.num_rows
+
+
+def load_manifest(root: Path) -> dict:
+    path = root / MANIFEST
+    if not path.exists():
+        return {"partitions": {}}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def write_manifest(root: Path, manifest: dict, name: str, schema: pa.Schema):
+    manifest["table"] = name
+    manifest["partition_column"] = "as_of"
+    manifest["compression"] = COMPRESSION
+    manifest["schema"] = [{"name": f.name, "type": str(f.type), "nullable": f.nullable} for f in schema]
+    manifest["total_rows"] = sum(p["rows"] for p in manifest["partitions"].values())
+    manifest["updated_at"] = datetime.now(timezone.utc).isoformat(timespec="seconds")
+    tmp = root / (MANIFEST + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp, root / MANIFEST)
+
+
+def export_table(get_conn, name: str, base_sql: str, schema: pa.Schema, root, since: date = None) -> list:
+    """
+    Export base_sql (one SELECT, as_of first, columns in schema order, no WHERE on as_of)
+    to root/name, one partition per as_of. Dates from the latest exported one on are
+    checked (see fingerprint_window); one is written when its part file is missing, its
+    row count or checksum differs from the manifest, or it is >= since.
+    Returns the list of exported dates.
+    """
+    root = Path(root) / name
+    root.mkdir(parents=True, exist_ok=True)
+    manifest = load_manifest(root)
+    done = exported_dates(root)
+    start, missing = fingerprint_window(manifest, done, since)
+
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            todo = []
+            for as_of, (n, checksum) in source_fingerprints(cur, base_sql, start, missing).items():
+                seen = manifest["partitions"].get(f"{as_of:%Y-%m-%d}", {})
+                if (as_of not in done or seen.get("rows") != n or seen.get("checksum") != checksum
+                        or (since and as_of >= since)):
+                    todo.append((as_of, checksum))
+            for as_of, checksum in todo:
+                n = write_partition(cur, root, base_sql, schema, as_of)
+                manifest["partitions"][f"{as_of:%Y-%m-%d}"] = {
+                    "rows": n,
+                    "checksum": checksum,
+                    "path": f"{partition_dir(root, as_of).name}/{PART_FILE}",
+                }
+    write_manifest(root, manifest, name, schema)
+    return [d for d, _ in todo]